@@ -0,0 +1,351 @@
+"""Teste de carga reproduzível de todas as rotas da API.
+
+Roda o `app` no próprio processo (cliente ASGI do httpx) contra um MongoDB
+em memória (mongomock_motor) e semeia dados sintéticos. Em duas fases:
+
+1. cada rota isolada, com baixa concorrência: p50/p95/p99 por rota;
+2. uma mistura de tráfego de sala de aula: vazão total.
+
+O mongomock executa as consultas no próprio event loop; sob concorrência
+alta uma rota esperaria pelas consultas das outras e a latência medida
+seria a do loop bloqueado, não a da rota. Por isso as latências vêm só da
+fase isolada. O atraso máximo do loop em cada fase também é reportado.
+Rotas que consultam muitos documentos (ex: GET /user/progress) continuam
+dominadas pelo custo do mongomock, que não usa índices.
+
+Uso (a partir de backend/):
+    pip install -r requirements-dev.txt
+    python -m bench.carga                       # compara com bench/baseline.json
+    python -m bench.carga --salvar-baseline     # grava um novo baseline
+
+O mongomock não usa índices (toda consulta percorre a coleção), então
+serve para volumes pequenos. Para escala de produção use um mongod local
+descartável; o banco `alfabetizacao_bench` é apagado antes de cada execução:
+    python -m bench.carga --mongodb-url mongodb://localhost:27017 \
+        --usuarios 100000 --eventos 200 --dias 30 --baseline bench/baseline-mongod.json
+
+Sai com código 1 se alguma rota falhar ou ficar mais lenta que o baseline
+além da tolerância.
+"""
+from typing import Dict, List, Any, Callable, Awaitable
+from datetime import datetime, timedelta
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import sys
+import time
+
+BASELINE_PADRAO = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# Peso de cada operação na mistura de tráfego (alunos respondendo atividades)
+MISTURA = {
+    "POST /user/pontuacao": 35,
+    "GET /atividades/": 25,
+    "POST /user/progress": 10,
+    "GET /ranking": 10,
+    "GET /user/progress": 6,
+    "GET /ranking/me": 6,
+    "POST /user/events": 3,
+    "POST /token": 5,
+    "POST /register": 1,
+    "GET /health": 1,
+    "GET /": 1,
+    "GET /metrics": 1,
+    "GET /session/bootstrap": 2,
+    "GET /session/sync": 4,
+}
+
+
+def percentil(valores: List[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+async def semear(app, usuarios: int, eventos: int, dias: int, rng: random.Random):
+    import bcrypt
+    from historico import Historico, TIPO_PROGRESSO, TIPO_PONTUACAO
+    from ranking import Ranking
+
+    repo = app.state.repo
+    historico = Historico(repo)
+    ranking = Ranking(repo)
+    # Todos com a mesma senha: um único hash, no custo configurado
+    senha = bcrypt.hashpw(b"senha123", bcrypt.gensalt(rounds=app.state.senhas.rounds))
+    inicio = datetime.utcnow() - timedelta(days=dias)
+
+    lote = 1000
+    for base in range(0, usuarios, lote):
+        docs, buckets, quadros = [], [], []
+        for i in range(base, min(base + lote, usuarios)):
+            email = f"aluno{i}@escola.com"
+            pontuacao = rng.randint(0, 500)
+            progresso = [
+                {"nivel": rng.randint(1, 4), "pontuacao": rng.randint(0, 50),
+                 "data": inicio + timedelta(minutes=rng.randint(0, dias * 24 * 60 - 1))}
+                for _ in range(eventos)
+            ]
+            docs.append({
+                "username": f"aluno{i}",
+                "email": email,
+                "password": senha,
+                "created_at": inicio,
+                "pontuacao_total": pontuacao,
+                "nivel": max((e["nivel"] for e in progresso), default=1),
+            })
+            buckets.extend(historico.buckets(email, TIPO_PROGRESSO, progresso))
+            buckets.extend(historico.buckets(email, TIPO_PONTUACAO, [
+                {"pontuacao": e["pontuacao"], "data": e["data"]} for e in progresso
+            ]))
+            quadros.extend(ranking.atualizacoes_pontuacao(email, f"aluno{i}", pontuacao, datetime.utcnow()))
+        await repo.db.users.insert_many(docs)
+        if buckets:
+            await historico.colecao.insert_many(buckets)
+        await ranking.colecao.bulk_write([q.operacao() for q in quadros])
+
+
+def operacoes(cliente, tokens: List[str], usuarios: int, rng: random.Random,
+              catalogo: int = 0) -> Dict[str, Callable[[], Awaitable]]:
+    def auth():
+        return {"Authorization": f"Bearer {rng.choice(tokens)}"}
+
+    contador = iter(range(10 ** 9))
+    return {
+        "POST /user/pontuacao": lambda: cliente.post(
+            "/user/pontuacao", json={"pontuacao": rng.randint(0, 500)}, headers=auth()),
+        "GET /atividades/": lambda: cliente.get(f"/atividades/?nivel={rng.randint(1, 4)}"),
+        "POST /user/progress": lambda: cliente.post(
+            "/user/progress", json={"nivel": rng.randint(1, 4), "pontuacao": rng.randint(0, 50)}, headers=auth()),
+        "GET /ranking": lambda: cliente.get("/ranking"),
+        "GET /user/progress": lambda: cliente.get("/user/progress?limite=50", headers=auth()),
+        "GET /ranking/me": lambda: cliente.get("/ranking/me", headers=auth()),
+        "POST /user/events": lambda: cliente.post("/user/events", headers=auth(), json={"eventos": [
+            {"id": f"bench-{next(contador)}", "tipo": "progress", "nivel": rng.randint(1, 4),
+             "pontuacao": rng.randint(0, 50)}
+            for _ in range(10)
+        ]}),
+        "POST /token": lambda: cliente.post("/token", data={
+            "username": f"aluno{rng.randrange(usuarios)}@escola.com", "password": "senha123"}),
+        "POST /register": lambda: cliente.post("/register", json={
+            "username": "novo", "email": f"novo{next(contador)}@escola.com", "password": "senha123"}),
+        "GET /health": lambda: cliente.get("/health"),
+        "GET /": lambda: cliente.get("/"),
+        "GET /metrics": lambda: cliente.get("/metrics"),
+        "GET /session/bootstrap": lambda: cliente.get("/session/bootstrap", headers=auth()),
+        # Cliente que sincronizou há até um minuto, com o catálogo em dia
+        "GET /session/sync": lambda: cliente.get(
+            f"/session/sync?since={int(time.time() * 1000) - rng.randint(0, 60_000)}&catalogo={catalogo}",
+            headers=auth()),
+    }
+
+
+class MedidorLag:
+    """Maior atraso do event loop enquanto ativo (mesma ideia de metricas.medir_lag_loop)."""
+
+    def __init__(self, intervalo: float = 0.01):
+        self.intervalo = intervalo
+        self.maximo = 0.0
+        self._tarefa = None
+
+    async def _medir(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            inicio = loop.time()
+            await asyncio.sleep(self.intervalo)
+            self.maximo = max(self.maximo, loop.time() - inicio - self.intervalo)
+
+    async def __aenter__(self):
+        self.maximo = 0.0
+        self._tarefa = asyncio.create_task(self._medir())
+        return self
+
+    async def __aexit__(self, *exc):
+        self._tarefa.cancel()
+
+
+async def executar(args) -> Dict[str, Dict[str, float]]:
+    import httpx
+    import main
+
+    rng = random.Random(args.seed)
+    app = main.app
+    if args.mongodb_url:
+        from database import criar_cliente, MONGODB_DB
+        client = criar_cliente()
+        await client.drop_database(MONGODB_DB)
+        client.close()
+    else:
+        from mongomock_motor import AsyncMongoMockClient
+        app.state.mongo_client_factory = AsyncMongoMockClient
+
+    async with app.router.lifespan_context(app):
+        while not app.state.bootstrap.pronto:
+            await asyncio.sleep(0.05)
+        t0 = time.perf_counter()
+        await semear(app, args.usuarios, args.eventos, args.dias, rng)
+        print(f"… {args.usuarios} usuários semeados em {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+
+        ativos = min(args.usuarios, args.alunos_ativos)
+        tokens = [main.create_access_token({"sub": f"aluno{i}@escola.com"}) for i in range(ativos)]
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as cliente:
+            ops = operacoes(cliente, tokens, ativos, rng, app.state.catalogo.versao or 0)
+            nomes = list(MISTURA)
+            latencias: Dict[str, List[float]] = {n: [] for n in nomes}
+            erros: Dict[str, int] = {n: 0 for n in nomes}
+
+            async def uma(nome: str, limite: asyncio.Semaphore, medir: bool):
+                async with limite:
+                    inicio = time.perf_counter()
+                    resposta = await ops[nome]()
+                    if medir:
+                        latencias[nome].append((time.perf_counter() - inicio) * 1000)
+                    if resposta.status_code >= 400:
+                        erros[nome] += 1
+
+            # Aquecimento: preenche caches (inclusive o de usuários de cada token)
+            # e carrega os quadros do ranking
+            for nome in nomes:
+                await ops[nome]()
+            for token in tokens:
+                await cliente.get("/ranking/me", headers={"Authorization": f"Bearer {token}"})
+
+            # Fase 1: latência de cada rota sem disputar o loop com as outras.
+            # A fila de escrita só é gravada entre uma rota e outra, fora da medição
+            fila = app.state.fila_escrita
+            intervalo, max_eventos = fila.intervalo, fila.max_eventos
+            fila.intervalo, fila.max_eventos = 3600.0, fila.limite
+            await fila.descarregar()
+            async with MedidorLag() as lag_isolada:
+                for nome in nomes:
+                    gc.collect()  # Coleta pendente de uma rota não cai na medição da seguinte
+                    limite = asyncio.Semaphore(args.concorrencia_rota)
+                    await asyncio.gather(*(uma(nome, limite, True) for _ in range(args.por_rota)))
+                    await fila.descarregar()
+            fila.intervalo, fila.max_eventos = intervalo, max_eventos
+
+            # Fase 2: vazão da mistura de tráfego
+            sequencia = rng.choices(nomes, weights=[MISTURA[n] for n in nomes], k=args.requisicoes)
+            limite = asyncio.Semaphore(args.concorrencia)
+            async with MedidorLag() as lag_mistura:
+                inicio = time.perf_counter()
+                await asyncio.gather(*(uma(nome, limite, False) for nome in sequencia))
+                duracao = time.perf_counter() - inicio
+
+    resultado = {}
+    for nome in nomes:
+        valores = latencias[nome]
+        resultado[nome] = {
+            "n": len(valores),
+            "p50_ms": round(percentil(valores, 50), 3),
+            "p95_ms": round(percentil(valores, 95), 3),
+            "p99_ms": round(percentil(valores, 99), 3),
+            "erros": erros[nome],
+        }
+    resultado["total"] = {
+        "n": args.requisicoes,
+        "rps": round(args.requisicoes / duracao, 1),
+        "lag_max_isolada_ms": round(lag_isolada.maximo * 1000, 1),
+        "lag_max_mistura_ms": round(lag_mistura.maximo * 1000, 1),
+    }
+    return resultado
+
+
+def comparar(resultado: Dict[str, Dict[str, float]], baseline: Dict[str, Any], tolerancia: float,
+             folga_ms: float = 1.0) -> List[str]:
+    falhas = []
+    for nome, medidas in resultado.items():
+        if medidas.get("erros"):
+            falhas.append(f"{nome}: {medidas['erros']} respostas com erro")
+        referencia = baseline.get("rotas", {}).get(nome)
+        if not referencia or not medidas.get("n"):
+            continue
+        if nome == "total":
+            minimo = referencia["rps"] * (1 - tolerancia)
+            if medidas["rps"] < minimo:
+                falhas.append(f"vazão total {medidas['rps']:.1f} req/s < {minimo:.1f} (baseline {referencia['rps']:.1f})")
+            continue
+        # A folga absoluta evita falsos alarmes em rotas de menos de 1 ms
+        limite = max(referencia["p95_ms"] * (1 + tolerancia), referencia["p95_ms"] + folga_ms)
+        if medidas["p95_ms"] > limite:
+            falhas.append(f"{nome}: p95 {medidas['p95_ms']:.2f}ms > {limite:.2f}ms (baseline {referencia['p95_ms']:.2f}ms)")
+    return falhas
+
+
+def imprimir(resultado: Dict[str, Dict[str, float]]):
+    print(f"{'rota (isolada)':<22} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'erros':>6}")
+    for nome, m in resultado.items():
+        if nome == "total":
+            continue
+        print(f"{nome:<22} {m['n']:>6} {m['p50_ms']:>9.2f} {m['p95_ms']:>9.2f} {m['p99_ms']:>9.2f} {m['erros']:>6}")
+    total = resultado["total"]
+    print(f"mistura: {total['n']} requisições, {total['rps']:.1f} req/s")
+    print(f"atraso máximo do loop: {total['lag_max_isolada_ms']:.1f} ms isolada, "
+          f"{total['lag_max_mistura_ms']:.1f} ms mistura")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongodb-url", help="mongod local descartável (padrão: mongomock em memória)")
+    parser.add_argument("--usuarios", type=int, default=300, help="usuários semeados")
+    parser.add_argument("--eventos", type=int, default=40, help="eventos de progresso por usuário")
+    parser.add_argument("--dias", type=int, default=3, help="dias cobertos pelo histórico semeado")
+    parser.add_argument("--alunos-ativos", type=int, default=100, help="usuários que geram tráfego")
+    parser.add_argument("--por-rota", type=int, default=100, help="requisições por rota na fase isolada")
+    parser.add_argument("--concorrencia-rota", type=int, default=1, help="concorrência na fase isolada")
+    parser.add_argument("--requisicoes", type=int, default=1000, help="requisições na fase de mistura")
+    parser.add_argument("--concorrencia", type=int, default=30, help="concorrência na fase de mistura")
+    parser.add_argument("--bcrypt-rounds", type=int, default=4, help="custo do bcrypt durante o teste")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", default=BASELINE_PADRAO)
+    parser.add_argument("--tolerancia", type=float, default=0.5, help="piora aceita no p95 (0.5 = 50%%)")
+    parser.add_argument("--folga-ms", type=float, default=1.0, help="piora absoluta sempre aceita no p95")
+    parser.add_argument("--salvar-baseline", action="store_true")
+    parser.add_argument("--json", action="store_true", help="imprime o resultado em JSON")
+    args = parser.parse_args()
+
+    # Configuração lida na importação dos módulos da API
+    os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    # Usuários aquecidos ficam no cache a execução toda: o p95 não oscila com expirações
+    os.environ.setdefault("PRINCIPAL_CACHE_TTL", "3600")
+    if args.mongodb_url:
+        os.environ["MONGODB_URL"] = args.mongodb_url
+        os.environ["MONGODB_DB"] = "alfabetizacao_bench"
+
+    resultado = asyncio.run(executar(args))
+    if args.json:
+        print(json.dumps(resultado, indent=2))
+    else:
+        imprimir(resultado)
+
+    parametros = {k: getattr(args, k) for k in ("mongodb_url", "usuarios", "eventos", "dias", "alunos_ativos",
+                                               "por_rota", "concorrencia_rota", "requisicoes", "concorrencia",
+                                               "bcrypt_rounds", "seed")}
+    if args.salvar_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"parametros": parametros, "rotas": resultado}, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        print(f"✅ Baseline salvo em {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"ℹ️ Sem baseline em {args.baseline}; use --salvar-baseline")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("parametros") != parametros:
+        print("⚠️ Parâmetros diferentes dos usados no baseline; a comparação pode não ser justa")
+    falhas = comparar(resultado, baseline, args.tolerancia, args.folga_ms)
+    for falha in falhas:
+        print(f"❌ {falha}")
+    if falhas:
+        sys.exit(1)
+    print("✅ Nenhuma regressão em relação ao baseline")
+
+
+if __name__ == "__main__":
+    main()
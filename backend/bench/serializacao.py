@@ -0,0 +1,158 @@
+"""Micro-benchmark do custo de codificar as respostas de cada rota.
+
+Compara, para payloads representativos, o caminho antigo (dicts passando
+pelo jsonable_encoder e pelo json da biblioteca padrão) com o atual
+(dicts validados pelo response_model e codificados com orjson),
+usando o mesmo `serialize_response` que o FastAPI chama em cada requisição.
+Também mostra o tamanho de cada resposta com e sem gzip.
+
+Uso (a partir de backend/):
+    python -m bench.serializacao [--repeticoes 2000]
+"""
+from typing import Dict, Any, Callable, Tuple
+from datetime import datetime, timedelta
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import time
+
+from fastapi.routing import APIRoute, serialize_response
+
+
+def _json_antigo(conteudo: Any) -> bytes:
+    # Mesmo render do JSONResponse do Starlette
+    return json.dumps(conteudo, ensure_ascii=False, allow_nan=False, indent=None,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def _progresso_antigo(username: str, eventos, proximo_cursor) -> bytes:
+    # Codificação de /user/progress antes do orjson, evento a evento
+    padrao = lambda o: o.isoformat() if isinstance(o, datetime) else str(o)
+    partes = [b'{"username":' + json.dumps(username, ensure_ascii=False).encode("utf-8") + b',"progress":[']
+    for i, evento in enumerate(eventos):
+        partes.append((b"," if i else b"") + json.dumps(
+            evento, ensure_ascii=False, separators=(",", ":"), default=padrao).encode("utf-8"))
+    partes.append(b'],"next_cursor":' + json.dumps(proximo_cursor).encode("utf-8") + b"}")
+    return b"".join(partes)
+
+
+def _progresso_atual(loop, username: str, eventos, proximo_cursor) -> bytes:
+    from main import _stream_progresso
+
+    async def paginas():
+        for evento in eventos:
+            yield evento, None
+        yield None, proximo_cursor
+
+    async def juntar():
+        gerador = paginas()
+        primeiro = await gerador.__anext__()
+        return b"".join([parte async for parte in _stream_progresso(username, primeiro, gerador)])
+
+    return loop.run_until_complete(juntar())
+
+
+def payloads() -> Dict[str, Tuple[Any, Any]]:
+    """Para cada rota: o dict que ela devolvia antes e o dict que devolve hoje."""
+    agora = datetime.utcnow()
+    faixa = [{"posicao": i + 1, "username": f"aluno{i}", "pontuacao_total": 5000 - i} for i in range(100)]
+    duplicados = [f"evento-{i:04d}" for i in range(500)]
+    estatisticas = {
+        "workers": 4, "fila": 0, "em_execucao": 0, "rejeitadas": 0, "hashes": 120,
+        "latencia_media_ms": 180.5, "latencia_max_ms": 410.2,
+    }
+    return {
+        "GET /health": (
+            {"status": "healthy", "database": "connected", "senhas": estatisticas, "timestamp": agora.isoformat()},
+            {"status": "healthy", "database": "connected", "senhas": estatisticas, "timestamp": agora},
+        ),
+        "POST /token": (
+            {"access_token": "x" * 180, "token_type": "bearer"},
+            {"access_token": "x" * 180, "token_type": "bearer"},
+        ),
+        "GET /ranking": (
+            {"ranking": faixa},
+            {"ranking": faixa},
+        ),
+        "GET /ranking/me": (
+            {"posicao": 50, "pontuacao_total": 4950, "total": 30000, "vizinhos": faixa[47:52]},
+            {"posicao": 50, "pontuacao_total": 4950, "total": 30000, "vizinhos": faixa[47:52]},
+        ),
+        "POST /user/pontuacao": (
+            {"message": "Pontuação atualizada com sucesso"},
+            {"message": "Pontuação atualizada com sucesso"},
+        ),
+        "POST /user/events": (
+            {"message": "Eventos registrados com sucesso", "aceitos": 0, "duplicados": duplicados},
+            {"message": "Eventos registrados com sucesso", "aceitos": 0, "duplicados": duplicados},
+        ),
+    }
+
+
+def medir(funcao: Callable[[], bytes], repeticoes: int) -> float:
+    funcao()
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao()
+    return (time.perf_counter() - inicio) / repeticoes * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeticoes", type=int, default=2000)
+    parser.add_argument("--eventos", type=int, default=1000, help="eventos na página de /user/progress")
+    args = parser.parse_args()
+
+    os.environ.setdefault("BCRYPT_ROUNDS", "4")
+    import main as api
+
+    app = api.app
+    rotas = {f"{next(iter(r.methods))} {r.path}": r for r in app.routes if isinstance(r, APIRoute)}
+    loop = asyncio.new_event_loop()
+
+    def antes(dados):
+        # Sem response_model o FastAPI passa o dict pelo jsonable_encoder
+        def codificar():
+            conteudo = loop.run_until_complete(serialize_response(response_content=dados))
+            return _json_antigo(conteudo)
+        return codificar
+
+    def depois(rota: APIRoute, dados):
+        # O response_model valida o dict uma vez e o pydantic já devolve tipos JSON
+        def codificar():
+            conteudo = loop.run_until_complete(serialize_response(
+                field=rota.response_field, response_content=dados))
+            return rota.response_class.render(None, conteudo)
+        return codificar
+
+    casos: Dict[str, Tuple[Callable[[], bytes], Callable[[], bytes]]] = {}
+    for nome, (dados, atuais) in payloads().items():
+        casos[nome] = (antes(dados), depois(rotas[nome], atuais))
+
+    inicio = datetime.utcnow() - timedelta(days=30)
+    eventos = [{"nivel": 1 + i % 4, "pontuacao": i % 50, "data": inicio + timedelta(minutes=i)}
+               for i in range(args.eventos)]
+    casos["GET /user/progress"] = (
+        lambda: _progresso_antigo("aluno1", eventos, "Y3Vyc29y"),
+        lambda: _progresso_atual(loop, "aluno1", eventos, "Y3Vyc29y"),
+    )
+
+    print(f"{'rota':<22} {'antes µs':>10} {'depois µs':>10} {'ganho':>7} {'bytes':>8} {'gzip':>8}")
+    for nome, (antigo, atual) in casos.items():
+        corpo_antigo, corpo_atual = antigo(), atual()
+        if json.loads(corpo_antigo) != json.loads(corpo_atual):
+            print(f"❌ {nome}: corpo diferente do formato anterior")
+        repeticoes = max(1, args.repeticoes // 20) if nome == "GET /user/progress" else args.repeticoes
+        t_antes = medir(antigo, repeticoes)
+        t_depois = medir(atual, repeticoes)
+        comprimido = len(gzip.compress(corpo_atual)) if len(corpo_atual) >= api.GZIP_TAMANHO_MINIMO else len(corpo_atual)
+        print(f"{nome:<22} {t_antes:>10.1f} {t_depois:>10.1f} {t_antes / t_depois:>6.1f}x "
+              f"{len(corpo_atual):>8} {comprimido:>8}")
+    loop.run_until_complete(loop.shutdown_asyncgens())
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+from typing import Optional, Dict, Any, List, Tuple
+from datetime import datetime, timedelta
+import asyncio
+import hashlib
+import json
+import os
+import uuid
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from database import Repositorio
+from logs import get_logger
+
+logger = get_logger("bootstrap")
+
+# Por quanto tempo as chaves de idempotência de POST /user/events são lembradas
+IDEMPOTENCIA_TTL_SEGUNDOS = int(os.getenv("IDEMPOTENCIA_TTL_SEGUNDOS", str(7 * 24 * 3600)))
+# Tempo máximo que um worker pode segurar o lock de bootstrap
+BOOTSTRAP_LOCK_SEGUNDOS = int(os.getenv("BOOTSTRAP_LOCK_SEGUNDOS", "60"))
+# Intervalo entre verificações enquanto outro worker executa o bootstrap
+BOOTSTRAP_ESPERA_SEGUNDOS = float(os.getenv("BOOTSTRAP_ESPERA_SEGUNDOS", "1"))
+# Espera máxima entre novas tentativas depois de uma falha (a espera dobra a cada falha)
+BOOTSTRAP_ESPERA_MAX_SEGUNDOS = float(os.getenv("BOOTSTRAP_ESPERA_MAX_SEGUNDOS", "30"))
+
+# Erros de criação de índice que repetir não resolve: chave duplicada nos dados
+# existentes e índice já existente com outras opções
+CODIGOS_INDICE_PERMANENTE = {11000, 85, 86}
+
+# Índices declarados: (coleção, chaves, opções)
+INDICES: List[Tuple[str, List[Tuple[str, int]], Dict[str, Any]]] = [
+    ("users", [("email", ASCENDING)], {"unique": True}),
+    ("users", [("pontuacao_total", DESCENDING)], {}),
+    ("atividades", [("nivel", ASCENDING)], {}),
+    ("historico", [("usuario", ASCENDING), ("tipo", ASCENDING), ("dia", ASCENDING), ("n", ASCENDING)], {}),
+    ("historico", [("usuario", ASCENDING), ("tipo", ASCENDING), ("_id", ASCENDING)], {}),
+    ("ranking", [("quadro", ASCENDING), ("pontuacao", DESCENDING)], {}),
+    ("ranking", [("quadro", ASCENDING), ("atualizado", ASCENDING)], {}),
+    ("eventos_processados", [("criado_em", ASCENDING)], {"expireAfterSeconds": IDEMPOTENCIA_TTL_SEGUNDOS}),
+]
+
+ATIVIDADES_PADRAO = [
+    {"_id": 1, "tipo": "letra", "conteudo": "A", "dica": "Qual é o som que essa letra faz?", "nivel": 1},
+    {"_id": 2, "tipo": "letra", "conteudo": "B", "dica": "Qual é o som que essa letra faz?", "nivel": 1},
+    {"_id": 3, "tipo": "letra", "conteudo": "C", "dica": "Qual é o som que essa letra faz?", "nivel": 1},
+    {"_id": 4, "tipo": "letra", "conteudo": "D", "dica": "Qual é o som que essa letra faz?", "nivel": 1},
+    {"_id": 5, "tipo": "letra", "conteudo": "E", "dica": "Qual é o som que essa letra faz?", "nivel": 1},
+
+    {"_id": 6, "tipo": "letra", "conteudo": "C _ S _", "dica": "Qual palavra pode ser formada aqui?", "nivel": 2},
+    {"_id": 7, "tipo": "letra", "conteudo": "P _ R _", "dica": "Qual palavra pode ser formada aqui?", "nivel": 2},
+    {"_id": 8, "tipo": "palavra", "conteudo": "O que é uma maçã?", "dica": "É uma fruta vermelha ou verde, doce e saudável.", "nivel": 2},
+    {"_id": 9, "tipo": "palavra", "conteudo": "O que é uma bola?", "dica": "É redonda e usamos para jogar.", "nivel": 2},
+    {"_id": 10, "tipo": "palavra", "conteudo": "O que é um cachorro?", "dica": "É um animal que ladra.", "nivel": 2},
+
+    {"_id": 11, "tipo": "silaba", "conteudo": "MAN e SÃO", "dica": "O que você forma ao juntar essas sílabas?", "nivel": 3},
+    {"_id": 12, "tipo": "silaba", "conteudo": "CA e SA", "dica": "O que você forma ao juntar essas sílabas?", "nivel": 3},
+    {"_id": 13, "tipo": "silaba", "conteudo": "BA e LA", "dica": "O que você forma ao juntar essas sílabas?", "nivel": 3},
+    {"_id": 14, "tipo": "silaba", "conteudo": "PA e RA", "dica": "O que você forma ao juntar essas sílabas?", "nivel": 3},
+    {"_id": 15, "tipo": "palavra", "conteudo": "O gato está no telhado.", "dica": "Onde está o gato?", "nivel": 3},
+
+    {"_id": 16, "tipo": "frase", "conteudo": "Eu vejo um ___.", "dica": "Complete a frase com um animal que você gosta.", "nivel": 4},
+    {"_id": 17, "tipo": "frase", "conteudo": "Hoje eu fui ao ___.", "dica": "Complete a frase com um lugar que você visita todo dia", "nivel": 4},
+    {"_id": 18, "tipo": "palavra", "conteudo": "O que é uma escola?", "dica": "É onde aprendemos, mas também pode ser um sinonimo.", "nivel": 4},
+    {"_id": 19, "tipo": "palavra", "conteudo": "O que é um livro?", "dica": "É onde encontramos histórias, onde lemos.", "nivel": 4},
+    {"_id": 20, "tipo": "letra", "conteudo": "A, B, C, D, E...", "dica": "Complete sua cartela com a ordem dessas letras.", "nivel": 4},
+]
+
+
+
+def _hash(dados) -> str:
+    return hashlib.sha256(json.dumps(dados, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+HASH_INDICES = _hash([[colecao, chaves, opcoes] for colecao, chaves, opcoes in INDICES])
+HASH_CATALOGO = _hash(ATIVIDADES_PADRAO)
+
+
+class Bootstrap:
+    """Cria os índices e semeia o catálogo uma única vez por versão.
+
+    O estado fica em meta.bootstrap com o hash dos índices declarados e do
+    catálogo padrão. Se os dois baterem, o worker não faz nada; caso
+    contrário apenas quem obtém o lock (meta.bootstrap_lock) executa o
+    trabalho, enquanto os demais aguardam o estado ficar em dia. Um índice
+    que os dados existentes impedem de criar não é tentado de novo em laço:
+    o worker fica pronto, mas degradado (`indices_com_erro`), e a criação é
+    repetida só no próximo início de um worker.
+    """
+
+    def __init__(self, repo: Repositorio):
+        self.repo = repo
+        self.meta = repo.db.meta
+        self.pronto = False
+        self.erro: Optional[str] = None
+        # Índices que não puderam ser criados sobre os dados atuais (worker pronto, mas degradado)
+        self.indices_com_erro: List[str] = []
+        self._dono = uuid.uuid4().hex
+
+    async def _estado(self) -> Dict[str, Any]:
+        return await self.meta.find_one({"_id": "bootstrap"}) or {}
+
+    @staticmethod
+    def _em_dia(estado: Dict[str, Any]) -> bool:
+        return estado.get("hash_indices") == HASH_INDICES and estado.get("hash_catalogo") == HASH_CATALOGO
+
+    async def _adquirir_lock(self) -> bool:
+        agora = datetime.utcnow()
+        try:
+            # Só casa com um lock expirado; se outro worker o detém, o upsert colide no _id
+            await self.meta.update_one(
+                {"_id": "bootstrap_lock", "expira": {"$lt": agora}},
+                {"$set": {"dono": self._dono, "expira": agora + timedelta(seconds=BOOTSTRAP_LOCK_SEGUNDOS)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def _liberar_lock(self):
+        await self.meta.delete_one({"_id": "bootstrap_lock", "dono": self._dono})
+
+    async def _criar_indices(self) -> List[str]:
+        """Cria os índices um a um; retorna os que os dados atuais impedem de criar."""
+        com_erro = []
+        for colecao, chaves, opcoes in INDICES:
+            try:
+                await self.repo.db[colecao].create_indexes([IndexModel(chaves, **opcoes)])
+            except OperationFailure as e:
+                if e.code not in CODIGOS_INDICE_PERMANENTE:
+                    raise
+                # Ex: emails repetidos gravados antes do índice único; exige correção manual
+                indice = f"{colecao} {chaves} {opcoes}"
+                logger.error("Índice não pode ser criado sobre os dados existentes",
+                             extra={"indice": indice, "codigo": e.code, "erro": str(e)})
+                com_erro.append(indice)
+        return com_erro
+
+    async def executar(self) -> bool:
+        """Deixa o banco em dia; retorna True se este worker fez o trabalho."""
+        while True:
+            if self._em_dia(await self._estado()):
+                self.pronto = True
+                return False
+            if await self._adquirir_lock():
+                break
+            await asyncio.sleep(BOOTSTRAP_ESPERA_SEGUNDOS)
+
+        try:
+            estado = await self._estado()
+            concluido: Dict[str, Any] = {"hash_catalogo": HASH_CATALOGO, "concluido_em": datetime.utcnow()}
+            if estado.get("hash_indices") != HASH_INDICES:
+                self.indices_com_erro = await self._criar_indices()
+                if not self.indices_com_erro:
+                    concluido["hash_indices"] = HASH_INDICES
+                    logger.info("Índices garantidos", extra={"indices": len(INDICES)})
+            if estado.get("hash_catalogo") != HASH_CATALOGO:
+                await self.repo.salvar_atividades(ATIVIDADES_PADRAO)
+                await self.repo.incrementar_versao_catalogo(a["nivel"] for a in ATIVIDADES_PADRAO)
+                logger.info("Catálogo padrão gravado", extra={"atividades": len(ATIVIDADES_PADRAO)})
+            # Sem hash_indices os índices com erro são tentados de novo no próximo início, não em laço
+            concluido["indices_com_erro"] = self.indices_com_erro
+            await self.meta.update_one({"_id": "bootstrap"}, {"$set": concluido}, upsert=True)
+        finally:
+            await self._liberar_lock()
+
+        self.pronto = True
+        return True
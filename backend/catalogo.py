@@ -0,0 +1,128 @@
+from typing import Dict, Optional, List, Any, Tuple
+import asyncio
+import hashlib
+import os
+
+from pymongo.errors import PyMongoError
+
+from database import Repositorio
+from logs import get_logger
+from respostas import para_json
+
+logger = get_logger("catalogo")
+
+# Intervalo entre consultas ao documento de versão quando não há change stream
+CATALOGO_INTERVALO_VERIFICACAO = float(os.getenv("CATALOGO_INTERVALO_VERIFICACAO", "30"))
+
+
+class EntradaCatalogo:
+    __slots__ = ("atividades", "corpo", "etag", "versao")
+
+    def __init__(self, nivel: int, atividades: List[Dict[str, Any]], versao: int = 0):
+        self.atividades = atividades
+        self.corpo = _serializar(nivel, atividades)
+        # ETag forte: muda sempre que o corpo serializado muda
+        self.etag = '"' + hashlib.sha256(self.corpo).hexdigest()[:32] + '"'
+        # Versão do catálogo (meta.catalogo) em que o nível mudou pela última vez; guia /session/sync
+        self.versao = versao
+
+    def corresponde(self, if_none_match: Optional[str]) -> bool:
+        # Comparação fraca (RFC 7232): proxies que comprimem a resposta (ex: nginx) trocam o ETag por W/"..."
+        if not if_none_match:
+            return False
+        etags = [e.strip() for e in if_none_match.split(",")]
+        return "*" in etags or self.etag in (e[2:] if e.startswith("W/") else e for e in etags)
+
+
+def _serializar(nivel: int, atividades: List[Dict[str, Any]]) -> bytes:
+    # Mesmo formato que a rota retornava antes do cache
+    return para_json({"nivel": nivel, "total": len(atividades), "atividades": atividades})
+
+
+def _versoes_por_nivel(estado: Dict[str, Any]) -> Tuple[int, int, Dict[int, int]]:
+    """Versão atual, versão base e versão da última alteração de cada nível.
+
+    `alteracoes` (meta.catalogo) guarda os níveis alterados em cada uma das
+    últimas versões. Níveis sem alteração registrada valem a versão base: a
+    anterior à janela guardada ou a última incrementada sem informar os
+    níveis (edição fora da API). Na dúvida o nível é reenviado.
+    """
+    versao = estado.get("versao", 0)
+    registradas = {a["versao"]: a["niveis"] for a in estado.get("alteracoes") or []}
+    base = min(registradas, default=versao + 1) - 1
+    for v in range(base + 1, versao + 1):
+        if v not in registradas:
+            base = v
+    por_nivel: Dict[int, int] = {}
+    for v in sorted(registradas):
+        if v > base:
+            for nivel in registradas[v]:
+                por_nivel[nivel] = v
+    return versao, base, por_nivel
+
+
+class CatalogoCache:
+    """Catálogo de atividades em memória, já serializado por nível.
+
+    Cada worker mantém sua cópia. Edições no catálogo devem incrementar o
+    documento de versão (meta.catalogo, de preferência informando os níveis
+    alterados); o worker percebe a mudança por change stream quando o
+    MongoDB é um replica set, ou consultando a versão periodicamente caso
+    contrário. A versão de cada nível vem desse documento, comum a todos os
+    workers, e não do relógio de quem recarregou.
+    """
+
+    def __init__(self, repo: Repositorio, intervalo: float = CATALOGO_INTERVALO_VERIFICACAO):
+        self.repo = repo
+        self.intervalo = intervalo
+        self.versao: Optional[int] = None
+        self._por_nivel: Dict[int, EntradaCatalogo] = {}
+
+    async def carregar(self):
+        # Versão lida antes das atividades: na dúvida o conteúdo é mais novo que a versão
+        versao, base, versoes = _versoes_por_nivel(await self.repo.estado_catalogo())
+        por_nivel: Dict[int, List[Dict[str, Any]]] = {}
+        for atividade in await self.repo.listar_todas_atividades():
+            por_nivel.setdefault(atividade["nivel"], []).append(atividade)
+        self._por_nivel = {
+            nivel: EntradaCatalogo(nivel, atividades, versoes.get(nivel, base))
+            for nivel, atividades in por_nivel.items()
+        }
+        self.versao = versao
+
+    def obter(self, nivel: int) -> EntradaCatalogo:
+        entrada = self._por_nivel.get(nivel)
+        if entrada is None:
+            entrada = EntradaCatalogo(nivel, [])
+        return entrada
+
+    def niveis(self) -> List[int]:
+        return sorted(self._por_nivel)
+
+    def alterados_desde(self, versao: Optional[int]) -> Dict[int, EntradaCatalogo]:
+        """Níveis alterados depois da versão `versao` do catálogo (todos se None)."""
+        return {
+            nivel: e for nivel, e in sorted(self._por_nivel.items())
+            if versao is None or e.versao > versao
+        }
+
+    async def vigiar(self):
+        try:
+            async with self.repo.db.atividades.watch() as stream:
+                # Recarrega depois de abrir o stream para não perder edições no intervalo
+                await self.carregar()
+                async for _ in stream:
+                    await self.carregar()
+        except (PyMongoError, NotImplementedError, TypeError) as e:
+            # Servidor standalone não tem change streams; substitutos em memória
+            # (mongomock) nem implementam watch()
+            logger.info("Change stream indisponível, verificando a versão do catálogo periodicamente",
+                        extra={"motivo": type(e).__name__, "intervalo_s": self.intervalo})
+
+        while True:
+            await asyncio.sleep(self.intervalo)
+            try:
+                if await self.repo.versao_catalogo() != self.versao:
+                    await self.carregar()
+            except PyMongoError as e:
+                logger.error("Erro ao atualizar catálogo", extra={"erro": str(e)})
@@ -0,0 +1,174 @@
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from metricas import ouvintes_mongodb
+from typing import Optional, Dict, Any, List, Callable, Set, Iterable, Tuple
+from datetime import datetime
+import os
+
+# Configurações do pool de conexões (por worker do gunicorn)
+MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
+MONGODB_DB = os.getenv("MONGODB_DB", "alfabetizacao")
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "50"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGODB_CONNECT_TIMEOUT_MS = int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", "5000"))
+MONGODB_SOCKET_TIMEOUT_MS = int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", "10000"))
+
+# Versões do catálogo cujos níveis alterados ficam guardados em meta.catalogo
+CATALOGO_ALTERACOES = 100
+
+
+def criar_cliente():
+    return AsyncIOMotorClient(
+        MONGODB_URL,
+        maxPoolSize=MONGODB_MAX_POOL_SIZE,
+        minPoolSize=MONGODB_MIN_POOL_SIZE,
+        serverSelectionTimeoutMS=MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        connectTimeoutMS=MONGODB_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=MONGODB_SOCKET_TIMEOUT_MS,
+        event_listeners=ouvintes_mongodb(),
+    )
+
+
+class Repositorio:
+    """Acesso assíncrono ao MongoDB: usuários, atividades, versão do catálogo
+    e chaves de idempotência.
+
+    O histórico e os quadros de ranking têm classes próprias (Historico,
+    Ranking), donas das respectivas coleções, que recebem o repositório para
+    usar o mesmo cliente. Recebe um cliente compatível com o motor, o que
+    permite trocar o banco real por um substituto em memória (ex:
+    mongomock_motor) nos testes.
+    """
+
+    def __init__(self, client, nome_db: str = MONGODB_DB):
+        self.client = client
+        self.db = client[nome_db]
+
+    async def ping(self):
+        await self.client.admin.command("ping")
+
+    def fechar(self):
+        self.client.close()
+
+    # Usuários
+    async def buscar_usuario(self, email: str, projecao: Optional[Dict[str, Any]] = None):
+        return await self.db.users.find_one({"email": email}, projecao)
+
+    async def criar_usuario(self, dados: Dict[str, Any]):
+        return await self.db.users.insert_one(dados)
+
+    async def atualizar_senha(self, email: str, hashed: bytes):
+        await self.db.users.update_one({"email": email}, {"$set": {"password": hashed}})
+
+    @staticmethod
+    def _atualizacao_pontuacao(email: str, pontuacao_total: int, data: datetime) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        # Não sobrescreve uma pontuação mais recente (ex: lote offline atrasado)
+        filtro = {"email": email, "$or": [
+            {"pontuacao_data": {"$exists": False}},
+            {"pontuacao_data": {"$lte": data}},
+        ]}
+        return filtro, {"$set": {"pontuacao_total": pontuacao_total, "pontuacao_data": data,
+                                 "atualizado": datetime.utcnow()}}
+
+    def operacao_pontuacao(self, email: str, pontuacao_total: int, data: datetime) -> UpdateOne:
+        return UpdateOne(*self._atualizacao_pontuacao(email, pontuacao_total, data))
+
+    @staticmethod
+    def operacao_nivel(email: str, nivel: int) -> UpdateOne:
+        # Só grava (e marca `atualizado`, usado por /session/sync) quando o nível sobe.
+        # Contas sem o campo ficam de fora: o nível delas vem do histórico (completar_nivel)
+        return UpdateOne({"email": email, "nivel": {"$lt": nivel}},
+                         {"$set": {"nivel": nivel, "atualizado": datetime.utcnow()}})
+
+    async def gravar_usuarios(self, operacoes: List[UpdateOne], ordered: bool = True):
+        await self.db.users.bulk_write(operacoes, ordered=ordered)
+
+    async def atualizar_pontuacao(self, email: str, pontuacao_total: int, data: datetime) -> bool:
+        """Grava a pontuação se ela for a mais recente; retorna False se havia uma mais nova."""
+        resultado = await self.db.users.update_one(*self._atualizacao_pontuacao(email, pontuacao_total, data))
+        return resultado.matched_count > 0
+
+    async def completar_nivel(self, email: str, nivel: int) -> datetime:
+        """Grava o nível de uma conta anterior ao campo; $max não rebaixa um nível gravado no meio tempo."""
+        agora = datetime.utcnow()
+        await self.db.users.update_one({"email": email}, {"$max": {"nivel": nivel}, "$set": {"atualizado": agora}})
+        return agora
+
+    def usuarios_com_pontuacao(self, lote: int):
+        return self.db.users.find(
+            {"pontuacao_total": {"$exists": True}},
+            {"_id": 0, "email": 1, "username": 1, "pontuacao_total": 1}
+        ).batch_size(lote)
+
+    def usuarios_com_campos(self, campos: List[str], lote: int):
+        """Usuários com algum dos arrays `campos` não vazio (migração de dados antigos)."""
+        filtro = {"$or": [{f"{campo}.0": {"$exists": True}} for campo in campos]}
+        projecao = {"_id": 0, "email": 1, **{campo: 1 for campo in campos}}
+        return self.db.users.find(filtro, projecao).batch_size(lote)
+
+    # Chaves de idempotência dos eventos enviados em lote
+    async def registrar_chaves(self, email: str, chaves: List[str]) -> Set[str]:
+        """Grava as chaves e retorna as que já existiam."""
+        agora = datetime.utcnow()
+        try:
+            await self.db.eventos_processados.insert_many(
+                [{"_id": f"{email}|{chave}", "criado_em": agora} for chave in chaves],
+                ordered=False
+            )
+        except BulkWriteError as e:
+            erros = e.details.get("writeErrors", [])
+            if any(erro["code"] != 11000 for erro in erros):
+                raise
+            return {chaves[erro["index"]] for erro in erros}
+        return set()
+
+    async def remover_chaves(self, email: str, chaves: List[str]):
+        await self.db.eventos_processados.delete_many({"_id": {"$in": [f"{email}|{c}" for c in chaves]}})
+
+    # Atividades
+    async def listar_todas_atividades(self) -> List[Dict[str, Any]]:
+        cursor = self.db.atividades.find({}, {"_id": 0}).sort([("nivel", 1), ("_id", 1)])
+        return await cursor.to_list(length=None)
+
+    async def salvar_atividades(self, atividades: List[Dict[str, Any]]):
+        # Um único bulk_write; cada atividade é atualizada ou inserida pela chave única
+        await self.db.atividades.bulk_write(
+            [UpdateOne({"_id": a["_id"]}, {"$set": a}, upsert=True) for a in atividades],
+            ordered=False
+        )
+
+    # Versão do catálogo: incrementada a cada edição para invalidar os caches dos workers
+    async def versao_catalogo(self) -> int:
+        doc = await self.db.meta.find_one({"_id": "catalogo"}, {"versao": 1})
+        return doc["versao"] if doc else 0
+
+    async def estado_catalogo(self) -> Dict[str, Any]:
+        """Versão do catálogo e os níveis alterados em cada uma das últimas versões."""
+        return await self.db.meta.find_one({"_id": "catalogo"}) or {"versao": 0}
+
+    async def incrementar_versao_catalogo(self, niveis: Iterable[int]) -> int:
+        """Incrementa a versão registrando os níveis alterados nela; retorna a nova versão."""
+        niveis = sorted(set(niveis))
+        while True:
+            versao = await self.versao_catalogo()
+            alteracao = {"versao": versao + 1, "niveis": niveis}
+            try:
+                # Só grava se ninguém incrementou a versão desde a leitura
+                await self.db.meta.update_one(
+                    {"_id": "catalogo", "versao": versao},
+                    {"$set": {"versao": versao + 1},
+                     "$push": {"alteracoes": {"$each": [alteracao], "$slice": -CATALOGO_ALTERACOES}}},
+                    upsert=True
+                )
+                return versao + 1
+            except DuplicateKeyError:
+                continue
+
+
+async def conectar(client_factory: Optional[Callable[[], Any]] = None) -> Repositorio:
+    # Cada worker cria o próprio cliente depois do fork do gunicorn
+    client = (client_factory or criar_cliente)()
+    return Repositorio(client)
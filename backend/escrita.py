@@ -0,0 +1,297 @@
+from typing import Optional, Dict, Any, List, Tuple
+from datetime import datetime
+import asyncio
+import math
+import os
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from database import Repositorio
+from historico import Historico, TIPO_PROGRESSO, TIPO_PONTUACAO
+from ranking import Ranking, Atualizacao, QUADRO_GERAL
+from logs import get_logger
+
+logger = get_logger("escrita")
+
+# Descarrega quando a fila acumula esse número de eventos...
+FILA_ESCRITA_MAX_EVENTOS = int(os.getenv("FILA_ESCRITA_MAX_EVENTOS", "500"))
+# ...ou quando passa esse intervalo (segundos), o que vier primeiro
+FILA_ESCRITA_INTERVALO = float(os.getenv("FILA_ESCRITA_INTERVALO", "0.5"))
+# Eventos pendentes a partir dos quais novas escritas são recusadas com 503
+# (ex: MongoDB fora do ar e a fila só crescendo)
+FILA_ESCRITA_LIMITE = int(os.getenv("FILA_ESCRITA_LIMITE", "20000"))
+
+USUARIOS, HISTORICO, RANKING = "usuarios", "historico", "ranking"
+
+
+class FilaCheia(Exception):
+    """Fila de escrita no limite: o pedido deve ser repetido depois de retry_after segundos."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Fila de escrita cheia")
+        self.retry_after = retry_after
+
+
+class Pendente:
+    """Atualizações ainda não gravadas de um usuário, já combinadas.
+
+    Cada evento de histórico leva um `id`; depois de uma gravação que falhou
+    (`verificar_historico`) os eventos já presentes no MongoDB são descartados
+    antes de tentar de novo, para o `$push` não duplicá-los.
+    """
+
+    __slots__ = ("username", "pontuacao_total", "data_pontuacao", "nivel", "eventos", "ranking",
+                 "verificar_historico")
+
+    def __init__(self, username: str):
+        self.username = username
+        self.pontuacao_total: Optional[int] = None
+        self.data_pontuacao: Optional[datetime] = None
+        # Maior nível com progresso registrado
+        self.nivel: Optional[int] = None
+        self.eventos: Dict[str, List[Dict[str, Any]]] = {TIPO_PROGRESSO: [], TIPO_PONTUACAO: []}
+        self.ranking: Dict[str, Atualizacao] = {}
+        self.verificar_historico = False
+
+    def __len__(self):
+        return len(self.eventos[TIPO_PROGRESSO]) + len(self.eventos[TIPO_PONTUACAO])
+
+    def vazio(self) -> bool:
+        return (self.pontuacao_total is None and self.nivel is None
+                and not len(self) and not self.ranking)
+
+    def pontuacao(self, pontuacao: int, data: datetime, id: Any = None):
+        # Vale a pontuação mais recente
+        if self.data_pontuacao is None or data >= self.data_pontuacao:
+            self.pontuacao_total = pontuacao
+            self.data_pontuacao = data
+        self.eventos[TIPO_PONTUACAO].append({"id": id or ObjectId(), "pontuacao": pontuacao, "data": data})
+
+    def progresso(self, nivel: int, pontuacao: int, data: datetime, id: Any = None):
+        self.nivel = nivel if self.nivel is None else max(self.nivel, nivel)
+        self.eventos[TIPO_PROGRESSO].append({"id": id or ObjectId(), "nivel": nivel, "pontuacao": pontuacao,
+                                             "data": data})
+
+    def quadros(self, atualizacoes: List[Atualizacao]):
+        for nova in atualizacoes:
+            atual = self.ranking.get(nova.quadro)
+            if atual is None:
+                self.ranking[nova.quadro] = nova
+            elif nova.maximo:
+                melhor = nova if nova.pontuacao > atual.pontuacao else atual
+                self.ranking[nova.quadro] = melhor._replace(data=max(atual.data, nova.data))
+            elif nova.data >= atual.data:
+                self.ranking[nova.quadro] = nova
+
+    def concluir(self, parte: str):
+        # Esquece o que já foi gravado, para uma nova tentativa repetir só o resto
+        if parte == USUARIOS:
+            self.pontuacao_total = self.data_pontuacao = self.nivel = None
+        elif parte == HISTORICO:
+            self.eventos = {TIPO_PROGRESSO: [], TIPO_PONTUACAO: []}
+            self.verificar_historico = False
+        elif parte == RANKING:
+            self.ranking = {}
+
+    def absorver(self, anterior: "Pendente"):
+        # Recoloca na frente atualizações de uma gravação que falhou
+        self.verificar_historico = self.verificar_historico or anterior.verificar_historico
+        if anterior.data_pontuacao is not None and (
+                self.data_pontuacao is None or anterior.data_pontuacao > self.data_pontuacao):
+            self.pontuacao_total = anterior.pontuacao_total
+            self.data_pontuacao = anterior.data_pontuacao
+        if anterior.nivel is not None:
+            self.nivel = anterior.nivel if self.nivel is None else max(self.nivel, anterior.nivel)
+        for tipo, eventos in anterior.eventos.items():
+            self.eventos[tipo] = eventos + self.eventos[tipo]
+        self.quadros(list(anterior.ranking.values()))
+
+
+class FilaEscrita:
+    """Write-behind das pontuações e do progresso de cada worker.
+
+    As rotas só enfileiram; as atualizações do mesmo usuário são combinadas
+    (a última pontuação total vence, os eventos de histórico se acumulam) e
+    gravadas em bulk_write ordenados quando a fila enche ou o intervalo
+    passa. Se uma das escritas falhar, só ela volta para a fila. Ao
+    desligar, o que estiver pendente é gravado antes de sair. Eventos ainda
+    na fila se perdem se o processo morrer sem desligar.
+    """
+
+    def __init__(self, repo: Repositorio, historico: Historico, ranking: Ranking,
+                 max_eventos: int = FILA_ESCRITA_MAX_EVENTOS, intervalo: float = FILA_ESCRITA_INTERVALO,
+                 limite: int = FILA_ESCRITA_LIMITE):
+        self.repo = repo
+        self.historico = historico
+        self.ranking = ranking
+        self.max_eventos = max_eventos
+        self.intervalo = intervalo
+        self.limite = limite
+        self._pendentes: Dict[str, Pendente] = {}
+        self._total_eventos = 0
+        self._cheia = asyncio.Event()
+        self._lock = asyncio.Lock()
+
+    def _pendente(self, email: str, username: str) -> Pendente:
+        pendente = self._pendentes.get(email)
+        if pendente is None:
+            pendente = self._pendentes[email] = Pendente(username)
+        return pendente
+
+    def _admitir(self):
+        if self._total_eventos >= self.limite:
+            raise FilaCheia(max(1, math.ceil(self.intervalo)))
+
+    def _contar(self, eventos: int):
+        self._total_eventos += eventos
+        if self._total_eventos >= self.max_eventos:
+            self._cheia.set()
+
+    def pontuacao(self, email: str, username: str, pontuacao: int, data: datetime):
+        self._admitir()
+        atualizacoes = self.ranking.atualizacoes_pontuacao(email, username, pontuacao, data)
+        pendente = self._pendente(email, username)
+        pendente.pontuacao(pontuacao, data)
+        pendente.quadros(atualizacoes)
+        # O ranking deste worker já mostra a pontuação antes da gravação
+        self.ranking.aplicar_local(atualizacoes)
+        self._contar(1)
+
+    def progresso(self, email: str, username: str, nivel: int, pontuacao: int, data: datetime):
+        self._admitir()
+        atualizacoes = self.ranking.atualizacoes_nivel(email, username, nivel, pontuacao, data)
+        pendente = self._pendente(email, username)
+        pendente.progresso(nivel, pontuacao, data)
+        pendente.quadros(atualizacoes)
+        self.ranking.aplicar_local(atualizacoes)
+        self._contar(1)
+
+    async def _descartar_gravados(self, email: str, pendente: Pendente):
+        for tipo, eventos in pendente.eventos.items():
+            if eventos:
+                gravados = await self.historico.existentes(email, tipo, eventos)
+                pendente.eventos[tipo] = [e for e in eventos if e["id"] not in gravados]
+
+    async def _gravar(self, pendentes: Dict[str, Pendente]) -> Tuple[int, List[BaseException]]:
+        """Grava as três partes em paralelo; retorna (partes gravadas, falhas).
+
+        Cada Pendente fica só com as partes que falharam.
+        """
+        verificar = [self._descartar_gravados(email, p) for email, p in pendentes.items() if p.verificar_historico]
+        if verificar:
+            await asyncio.gather(*verificar)
+
+        usuarios: List[UpdateOne] = []
+        historico: List[UpdateOne] = []
+        ranking: List[Atualizacao] = []
+        for email, pendente in pendentes.items():
+            if pendente.pontuacao_total is not None:
+                usuarios.append(self.repo.operacao_pontuacao(email, pendente.pontuacao_total, pendente.data_pontuacao))
+            if pendente.nivel is not None:
+                usuarios.append(self.repo.operacao_nivel(email, pendente.nivel))
+            for tipo, eventos in pendente.eventos.items():
+                historico.extend(self.historico.operacoes(email, tipo, eventos))
+            ranking.extend(pendente.ranking.values())
+
+        escritas = {}
+        if usuarios:
+            escritas[USUARIOS] = self.repo.gravar_usuarios(usuarios)
+        if historico:
+            escritas[HISTORICO] = self.historico.colecao.bulk_write(historico, ordered=True)
+        if ranking:
+            escritas[RANKING] = self.ranking.registrar(ranking)
+        resultados = await asyncio.gather(*escritas.values(), return_exceptions=True)
+
+        falhas = []
+        for parte, resultado in zip(escritas, resultados):
+            if isinstance(resultado, BaseException):
+                falhas.append(resultado)
+                if parte == HISTORICO:
+                    # Parte dos buckets pode ter sido gravada antes do erro
+                    for pendente in pendentes.values():
+                        pendente.verificar_historico = True
+            else:
+                for pendente in pendentes.values():
+                    pendente.concluir(parte)
+        return len(escritas) - len(falhas), falhas
+
+    def _reenfileirar(self, pendentes: Dict[str, Pendente]):
+        # Volta para a frente da fila o que não foi gravado
+        for email, anterior in pendentes.items():
+            if not anterior.vazio():
+                self._pendente(email, anterior.username).absorver(anterior)
+                self._contar(len(anterior))
+
+    async def gravar_agora(self, email: str, username: str,
+                           eventos: List[Tuple[str, str, Optional[int], int, datetime]]):
+        """Grava um lote de eventos (id, tipo, nivel, pontuacao, data) sem passar pela fila.
+
+        Só levanta exceção se nada foi gravado; se parte foi, o restante
+        fica na fila para a próxima gravação.
+        """
+        pendente = Pendente(username)
+        # Os ids do cliente viram os ids no histórico: um reenvio não duplica eventos
+        pendente.verificar_historico = True
+        for id, tipo, nivel, pontuacao, data in sorted(eventos, key=lambda e: e[4]):
+            if tipo == TIPO_PONTUACAO:
+                pendente.pontuacao(pontuacao, data, id)
+                pendente.quadros(self.ranking.atualizacoes_pontuacao(email, username, pontuacao, data))
+            else:
+                pendente.progresso(nivel, pontuacao, data, id)
+                pendente.quadros(self.ranking.atualizacoes_nivel(email, username, nivel, pontuacao, data))
+
+        gravadas = 0
+        if pendente.pontuacao_total is not None:
+            # O quadro geral só acompanha se a pontuação do lote for a mais recente
+            if not await self.repo.atualizar_pontuacao(email, pendente.pontuacao_total, pendente.data_pontuacao):
+                pendente.ranking.pop(QUADRO_GERAL, None)
+            pendente.pontuacao_total = None
+            gravadas += 1
+        try:
+            parciais, falhas = await self._gravar({email: pendente})
+        except Exception as e:
+            parciais, falhas = 0, [e]
+        gravadas += parciais
+        if not falhas:
+            return
+        if not gravadas:
+            raise falhas[0]
+        logger.error("Gravação parcial de eventos, o restante fica na fila", extra={
+            "eventos": len(pendente), "erro": str(falhas[0]),
+        })
+        self._reenfileirar({email: pendente})
+
+    async def descarregar(self) -> bool:
+        """Grava o que estiver pendente; retorna False se alguma escrita falhou."""
+        async with self._lock:
+            if not self._pendentes:
+                return True
+            pendentes, self._pendentes = self._pendentes, {}
+            self._total_eventos = 0
+            self._cheia.clear()
+            try:
+                _, falhas = await self._gravar(pendentes)
+            except Exception as e:
+                falhas = [e]
+            if not falhas:
+                return True
+            logger.error("Erro ao gravar a fila de escrita, tentando de novo", extra={
+                "eventos": sum(map(len, pendentes.values())), "erro": str(falhas[0]),
+            })
+            self._reenfileirar(pendentes)
+            return False
+
+    async def executar(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._cheia.wait(), timeout=self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            # shield: um cancelamento no desligamento não interrompe a gravação em curso
+            if not await asyncio.shield(self.descarregar()):
+                # Espera um intervalo antes de tentar de novo, mesmo com a fila cheia
+                await asyncio.sleep(self.intervalo)
+
+    async def fechar(self):
+        await self.descarregar()
@@ -0,0 +1,22 @@
+# Configuração do gunicorn (usada pelo Procfile)
+import os
+import shutil
+
+# As métricas de cada worker ficam em arquivos neste diretório e /metrics soma todas.
+# Precisa estar definido antes de qualquer import do prometheus_client: o modo
+# multiprocesso é escolhido na importação e herdado pelos workers
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc")
+
+from prometheus_client import multiprocess  # noqa: E402
+
+
+def on_starting(server):
+    # Limpa valores de execuções anteriores antes de criar os workers
+    diretorio = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(diretorio, ignore_errors=True)
+    os.makedirs(diretorio, exist_ok=True)
+
+
+def child_exit(server, worker):
+    # Gauges "live" deixam de contar o worker que saiu
+    multiprocess.mark_process_dead(worker.pid)
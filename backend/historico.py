@@ -0,0 +1,220 @@
+from typing import Optional, Dict, Any, List, AsyncIterator, Tuple, Set
+from datetime import datetime, timedelta, timezone
+import base64
+import os
+import struct
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from database import Repositorio
+
+# Máximo de eventos por bucket (um bucket por usuário, tipo e dia)
+HISTORICO_BUCKET_MAX = int(os.getenv("HISTORICO_BUCKET_MAX", "200"))
+
+TIPO_PROGRESSO = "progress"
+TIPO_PONTUACAO = "pontuacao"
+
+EPOCA = datetime(1970, 1, 1)
+
+
+def _dia(data: datetime) -> str:
+    # Datas sem fuso são UTC, como as gravadas pelas rotas
+    if data.tzinfo is not None:
+        data = data.astimezone(timezone.utc)
+    return data.strftime("%Y-%m-%d")
+
+
+def _utc_sem_fuso(data: datetime) -> datetime:
+    if data.tzinfo is not None:
+        data = data.astimezone(timezone.utc).replace(tzinfo=None)
+    return data
+
+
+def codificar_cursor(data: datetime, bucket_id: ObjectId, indice: int) -> str:
+    # Posição do último evento enviado na ordem (data, bucket, índice); datas do MongoDB têm precisão de ms
+    ms = (_utc_sem_fuso(data) - EPOCA) // timedelta(milliseconds=1)
+    return base64.urlsafe_b64encode(f"{ms}:{bucket_id}:{indice}".encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str) -> Tuple[datetime, ObjectId, int]:
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ms, bucket_id, indice = bruto.split(":")
+        return EPOCA + timedelta(milliseconds=int(ms)), ObjectId(bucket_id), int(indice)
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+
+def id_para_data(data: datetime) -> ObjectId:
+    # ObjectId cujo timestamp é o do primeiro evento, para manter a ordem
+    # cronológica de buckets criados depois (ex: pela migração)
+    return ObjectId(struct.pack(">I", int(data.timestamp())) + os.urandom(8))
+
+
+class Historico:
+    """Eventos de progresso e pontuação fora do documento do usuário.
+
+    Os eventos ficam em buckets na coleção `historico`, um por usuário, tipo
+    e dia, com no máximo HISTORICO_BUCKET_MAX eventos cada. Assim o documento
+    em `users` deixa de crescer e a leitura pode ser paginada.
+    """
+
+    def __init__(self, repo: Repositorio):
+        self.colecao = repo.db.historico
+
+    def operacoes(self, email: str, tipo: str, eventos: List[Dict[str, Any]]) -> List[UpdateOne]:
+        # Um upsert por dia e fatia: acrescenta a um bucket com espaço para a fatia inteira ou cria um novo
+        por_dia: Dict[str, List[Dict[str, Any]]] = {}
+        for evento in eventos:
+            por_dia.setdefault(_dia(evento["data"]), []).append(evento)
+        operacoes = []
+        for dia, do_dia in por_dia.items():
+            for i in range(0, len(do_dia), HISTORICO_BUCKET_MAX):
+                fatia = do_dia[i:i + HISTORICO_BUCKET_MAX]
+                operacoes.append(UpdateOne(
+                    {
+                        "usuario": email,
+                        "tipo": tipo,
+                        "dia": dia,
+                        "n": {"$lte": HISTORICO_BUCKET_MAX - len(fatia)},
+                        "migrado": {"$exists": False},
+                    },
+                    {"$push": {"eventos": {"$each": fatia}}, "$inc": {"n": len(fatia)}},
+                    upsert=True,
+                ))
+        return operacoes
+
+    async def registrar(self, email: str, tipo: str, eventos: List[Dict[str, Any]]):
+        operacoes = self.operacoes(email, tipo, eventos)
+        if operacoes:
+            await self.colecao.bulk_write(operacoes, ordered=True)
+
+    def buckets(self, email: str, tipo: str, eventos: List[Dict[str, Any]], **extra) -> List[Dict[str, Any]]:
+        """Agrupa eventos já existentes em documentos de bucket prontos para inserir."""
+        documentos = []
+        por_dia: Dict[str, List[Dict[str, Any]]] = {}
+        for evento in sorted(eventos, key=lambda e: e["data"]):
+            por_dia.setdefault(_dia(evento["data"]), []).append(evento)
+        for dia, do_dia in por_dia.items():
+            for i in range(0, len(do_dia), HISTORICO_BUCKET_MAX):
+                fatia = do_dia[i:i + HISTORICO_BUCKET_MAX]
+                documentos.append({
+                    "_id": id_para_data(fatia[0]["data"]),
+                    "usuario": email,
+                    "tipo": tipo,
+                    "dia": dia,
+                    "n": len(fatia),
+                    "eventos": fatia,
+                    **extra,
+                })
+        return documentos
+
+    async def _janelas(self, filtro_bucket: Dict[str, Any], alvo: int) -> AsyncIterator[Tuple[str, str]]:
+        """Faixas de dias (primeiro, último) com ao menos `alvo` eventos cada, contados pelos buckets.
+
+        Lê só `dia` e `n` (coberto pelo índice), para a agregação não precisar
+        desmontar todo o histórico a cada página.
+        """
+        primeiro = ultimo = None
+        total = 0
+        async for doc in self.colecao.find(filtro_bucket, {"_id": 0, "dia": 1, "n": 1}).sort("dia", 1):
+            if total >= alvo and doc["dia"] != ultimo:
+                yield primeiro, ultimo
+                primeiro, total = None, 0
+            if primeiro is None:
+                primeiro = doc["dia"]
+            ultimo = doc["dia"]
+            total += doc.get("n", 0)
+        if primeiro is not None:
+            yield primeiro, ultimo
+
+    async def paginar(
+        self,
+        email: str,
+        tipo: str,
+        limite: int,
+        cursor: Optional[str] = None,
+        nivel: Optional[int] = None,
+        desde: Optional[datetime] = None,
+        ate: Optional[datetime] = None,
+    ) -> AsyncIterator[Tuple[Dict[str, Any], Optional[str]]]:
+        """Gera (evento, None) em ordem cronológica e por último (None, próximo_cursor).
+
+        A ordem é (data do evento, bucket, índice no bucket), estável mesmo
+        quando um evento offline chega depois e cai em um bucket novo. Um
+        evento gravado com data anterior ao cursor não aparece nas páginas
+        seguintes de uma paginação já em andamento.
+        """
+        filtro_bucket: Dict[str, Any] = {"usuario": email, "tipo": tipo}
+        filtro_evento: Dict[str, Any] = {}
+        if desde or ate:
+            filtro_bucket["dia"] = {}
+            filtro_evento["eventos.data"] = {}
+            if desde:
+                filtro_bucket["dia"]["$gte"] = _dia(desde)
+                filtro_evento["eventos.data"]["$gte"] = desde
+            if ate:
+                filtro_bucket["dia"]["$lte"] = _dia(ate)
+                filtro_evento["eventos.data"]["$lt"] = ate
+        if nivel is not None:
+            filtro_evento["eventos.nivel"] = nivel
+        if cursor:
+            data, bucket_id, indice = decodificar_cursor(cursor)
+            dias = filtro_bucket.setdefault("dia", {})
+            dias["$gte"] = max(dias.get("$gte", ""), _dia(data))
+            filtro_evento["$or"] = [
+                {"eventos.data": {"$gt": data}},
+                {"eventos.data": data, "_id": {"$gt": bucket_id}},
+                {"eventos.data": data, "_id": bucket_id, "i": {"$gt": indice}},
+            ]
+
+        enviados = 0
+        ultimo = None
+        async for primeiro_dia, ultimo_dia in self._janelas(filtro_bucket, limite + 1):
+            pipeline = [
+                {"$match": {"usuario": email, "tipo": tipo, "dia": {"$gte": primeiro_dia, "$lte": ultimo_dia}}},
+                {"$unwind": {"path": "$eventos", "includeArrayIndex": "i"}},
+                {"$match": filtro_evento},
+                {"$sort": {"eventos.data": 1, "_id": 1, "i": 1}},
+                {"$limit": limite + 1 - enviados},
+                {"$project": {"_id": 1, "i": 1, "eventos": 1}},
+            ]
+            async for doc in self.colecao.aggregate(pipeline, batchSize=min(limite + 1, 500)):
+                if enviados == limite:
+                    # Há mais resultados: o cursor aponta para o último evento enviado
+                    yield None, codificar_cursor(*ultimo)
+                    return
+                evento = doc["eventos"]
+                ultimo = (evento["data"], doc["_id"], doc["i"])
+                enviados += 1
+                evento.pop("id", None)  # Uso interno (gravação idempotente)
+                yield evento, None
+        yield None, None
+
+    async def existentes(self, email: str, tipo: str, eventos: List[Dict[str, Any]]) -> Set[Any]:
+        """Ids destes eventos que já estão gravados, para repetir uma gravação sem duplicar."""
+        procurados = {e["id"] for e in eventos if "id" in e}
+        if not procurados:
+            return set()
+        filtro = {
+            "usuario": email,
+            "tipo": tipo,
+            "dia": {"$in": sorted({_dia(e["data"]) for e in eventos})},
+            "eventos.id": {"$in": list(procurados)},
+        }
+        gravados: Set[Any] = set()
+        async for doc in self.colecao.find(filtro, {"_id": 0, "eventos.id": 1}):
+            gravados.update(e["id"] for e in doc["eventos"] if e.get("id") in procurados)
+        return gravados
+
+    async def maior_nivel(self, email: str) -> Optional[int]:
+        """Maior nível entre os eventos de progresso do usuário, ou None se não houver."""
+        pipeline = [
+            {"$match": {"usuario": email, "tipo": TIPO_PROGRESSO}},
+            {"$unwind": "$eventos"},
+            {"$group": {"_id": None, "nivel": {"$max": "$eventos.nivel"}}},
+        ]
+        async for doc in self.colecao.aggregate(pipeline):
+            return doc["nivel"]
+        return None
@@ -0,0 +1,43 @@
+import json
+import logging
+import os
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+
+# Atributos padrão do LogRecord; o resto veio de `extra=` e vira campo do JSON
+_PADRAO = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class FormatoJSON(logging.Formatter):
+    """Uma linha JSON por evento, com os campos passados em `extra`."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        evento = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "pid": record.process,
+            "msg": record.getMessage(),
+        }
+        for chave, valor in vars(record).items():
+            if chave not in _PADRAO:
+                evento[chave] = valor
+        if record.exc_info:
+            evento["exc"] = self.formatException(record.exc_info)
+        return json.dumps(evento, ensure_ascii=False, default=str)
+
+
+def configurar_logging():
+    logger = logging.getLogger("alfabetizacao")
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(FormatoJSON())
+    logger.addHandler(handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+
+def get_logger(nome: str) -> logging.Logger:
+    return logging.getLogger(f"alfabetizacao.{nome}")
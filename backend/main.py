@@ -1,19 +1,39 @@
-from fastapi import FastAPI, HTTPException, Depends, Body
+from fastapi import FastAPI, HTTPException, Depends, Body, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from fastapi.responses import JSONResponse
-from pymongo import MongoClient
-from pydantic import BaseModel, EmailStr
-from typing import Optional, Dict, Any, List
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, EmailStr, Field
+from typing import Optional, Dict, Any, List, Literal
 import os
 from dotenv import load_dotenv
-import bcrypt
 from jose import JWTError, jwt
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from contextlib import asynccontextmanager, suppress
+import asyncio
+import random
 
-# Carregar variáveis de ambiente
+from pymongo.errors import DuplicateKeyError
+
+# Carregar variáveis de ambiente (antes dos módulos que leem configuração)
 load_dotenv()
 
+from database import Repositorio, conectar
+from senhas import ServicoSenhas, SobrecargaSenhas
+from catalogo import CatalogoCache
+from principal import ResolvedorPrincipal
+from historico import Historico, TIPO_PROGRESSO, decodificar_cursor
+from ranking import Ranking, QUADRO_GERAL, quadro_semana, quadro_nivel, RANKING_INTERVALO
+from bootstrap import Bootstrap, BOOTSTRAP_ESPERA_SEGUNDOS, BOOTSTRAP_ESPERA_MAX_SEGUNDOS
+from escrita import FilaEscrita, FilaCheia
+from sessao import Sessao
+from logs import configurar_logging, get_logger
+from metricas import MetricasMiddleware, exportar, TIPO_CONTEUDO, medir_lag_loop
+from respostas import RespostaJSON, para_json
+
+configurar_logging()
+logger = get_logger("api")
+
 # Modelos Pydantic
 class UserCreate(BaseModel):
     username: str
@@ -37,6 +57,16 @@ class ProgressUpdate(BaseModel):
     nivel: int
     pontuacao: int
 
+class EventoUsuario(BaseModel):
+    id: str = Field(..., min_length=1, max_length=100)  # Chave de idempotência gerada pelo cliente
+    tipo: Literal["progress", "pontuacao"]
+    pontuacao: int
+    nivel: Optional[int] = None
+    data: Optional[datetime] = None
+
+class EventosUsuario(BaseModel):
+    eventos: List[EventoUsuario] = Field(..., min_length=1, max_length=500)
+
 class Atividade(BaseModel):
     tipo: str
     conteudo: str
@@ -44,12 +74,161 @@ class Atividade(BaseModel):
     nivel: int
     audio_url: Optional[str] = None
 
+# Modelos de resposta: as rotas devolvem dicts, validados uma única vez
+# contra o response_model e convertidos pelo pydantic direto para JSON,
+# sem passar pelo jsonable_encoder
+class Mensagem(BaseModel):
+    message: str
+
+class Raiz(Mensagem):
+    docs: str
+    endpoints: Dict[str, List[str]]
+
+class EstatisticasSenhas(BaseModel):
+    workers: int
+    fila: int
+    em_execucao: int
+    rejeitadas: int
+    hashes: int
+    latencia_media_ms: float
+    latencia_max_ms: float
+
+class Saude(BaseModel):
+    status: str
+    database: str
+    senhas: EstatisticasSenhas
+    indices_com_erro: List[str] = []  # status "degraded": corrigir os dados e reiniciar
+    timestamp: datetime
+
+class UsuarioCriado(Mensagem):
+    username: str
+    email: str
+
+class AtividadesNivel(BaseModel):
+    nivel: int
+    total: int
+    atividades: List[Atividade]
+
+class EventoProgresso(BaseModel):
+    nivel: int
+    pontuacao: int
+    data: datetime
+
+class ProgressoPaginado(BaseModel):
+    username: str
+    progress: List[EventoProgresso]
+    next_cursor: Optional[str] = None
+
+class PosicaoRanking(BaseModel):
+    posicao: int
+    username: str
+    pontuacao_total: int
+
+class RankingResposta(BaseModel):
+    ranking: List[PosicaoRanking]
+
+class MinhaPosicao(BaseModel):
+    posicao: Optional[int] = None
+    pontuacao_total: Optional[int] = None
+    total: int
+    vizinhos: List[PosicaoRanking]
+
+class EventosRegistrados(Mensagem):
+    aceitos: int
+    duplicados: List[str]
+
+class EstadoUsuario(BaseModel):
+    username: str
+    nivel: int
+    pontuacao_total: int
+
+class EstadoSessao(BaseModel):
+    versao: int  # Enviar como `since` em /session/sync
+    completo: bool  # False: só as partes alteradas desde `since`
+    catalogo: int  # Enviar como `catalogo` em /session/sync
+    usuario: Optional[EstadoUsuario] = None
+    atividades: Dict[int, List[Atividade]]  # Por nível
+    ranking: Optional[List[PosicaoRanking]] = None
+
+# Índices e catálogo padrão em segundo plano; /health fica 503 até terminar.
+# Falhas (ex: MongoDB indisponível) são tentadas de novo com espera crescente
+async def executar_bootstrap(app: FastAPI):
+    espera = BOOTSTRAP_ESPERA_SEGUNDOS
+    while True:
+        try:
+            await app.state.bootstrap.executar()
+            await app.state.catalogo.carregar()
+            app.state.bootstrap.erro = None
+            logger.info("Bootstrap concluído")
+            return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            app.state.bootstrap.pronto = False
+            app.state.bootstrap.erro = str(e)
+            logger.exception("Erro no bootstrap, tentando de novo", extra={"espera_s": espera})
+        # Variação aleatória para os workers não tentarem todos ao mesmo tempo
+        await asyncio.sleep(espera * random.uniform(0.5, 1.0))
+        espera = min(espera * 2, BOOTSTRAP_ESPERA_MAX_SEGUNDOS)
+
+# Ciclo de vida: cada worker do gunicorn abre e fecha o próprio cliente MongoDB
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info("Iniciando servidor")
+    # Permite injetar um cliente alternativo (ex: mongomock_motor em testes)
+    client_factory = getattr(app.state, "mongo_client_factory", None)
+    repo = await conectar(client_factory)
+    app.state.repo = repo
+    app.state.senhas = ServicoSenhas()
+    app.state.principais = ResolvedorPrincipal(repo, decodificar_token)
+    app.state.historico = Historico(repo)
+    app.state.ranking = Ranking(repo)
+    app.state.bootstrap = Bootstrap(repo)
+    app.state.fila_escrita = FilaEscrita(repo, app.state.historico, app.state.ranking)
+    try:
+        # Teste a conexão com o MongoDB
+        await repo.ping()
+        logger.info("Conectado ao MongoDB")
+
+        # Catálogo em memória, atualizado quando a versão muda
+        app.state.catalogo = CatalogoCache(repo)
+        await app.state.catalogo.carregar()
+        app.state.sessao = Sessao(repo, app.state.historico, app.state.catalogo, app.state.ranking)
+    except Exception as e:
+        logger.exception("Erro na inicialização")
+        app.state.senhas.fechar()
+        repo.fechar()
+        raise e
+
+    tarefas = [
+        asyncio.create_task(executar_bootstrap(app)),
+        asyncio.create_task(app.state.catalogo.vigiar()),
+        asyncio.create_task(app.state.fila_escrita.executar()),
+        asyncio.create_task(medir_lag_loop()),
+    ]
+
+    yield
+
+    for tarefa in tarefas:
+        tarefa.cancel()
+        with suppress(asyncio.CancelledError):
+            await tarefa
+    # Grava o que ainda estiver na fila antes de fechar a conexão
+    await app.state.fila_escrita.fechar()
+    app.state.senhas.fechar()
+    repo.fechar()
+
 app = FastAPI(
     title="API de Alfabetização",
     description="API para aplicativo de alfabetização com sistema de autenticação",
     version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=RespostaJSON,
 )
 
+# Respostas menores que isso (bytes) não compensam comprimir
+GZIP_TAMANHO_MINIMO = int(os.getenv("GZIP_TAMANHO_MINIMO", "1000"))
+
 # Configuração CORS
 app.add_middleware(
     CORSMiddleware,
@@ -59,20 +238,63 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Comprime respostas grandes (ex: /user/progress) quando o cliente aceita gzip
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_TAMANHO_MINIMO)
+
+# Contagem e latência por rota (exportadas em /metrics)
+app.add_middleware(MetricasMiddleware)
+
+# Fila de hashing cheia: recusa com 503 em vez de enfileirar indefinidamente
+@app.exception_handler(SobrecargaSenhas)
+async def sobrecarga_senhas_handler(request: Request, exc: SobrecargaSenhas):
+    return RespostaJSON(
+        status_code=503,
+        content={"detail": "Servidor ocupado, tente novamente em instantes"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+# Fila de escrita no limite (ex: MongoDB fora do ar): recusa em vez de crescer sem fim
+@app.exception_handler(FilaCheia)
+async def fila_cheia_handler(request: Request, exc: FilaCheia):
+    return RespostaJSON(
+        status_code=503,
+        content={"detail": "Servidor ocupado, tente novamente em instantes"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 # Configurações JWT
 SECRET_KEY = os.getenv("SECRET_KEY", "sua-chave-secreta-aqui")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 horas
 
-# Conexão MongoDB
-MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
-client = MongoClient(MONGODB_URL)
-db = client.alfabetizacao
-
 # OAuth2
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 # Funções auxiliares
+def get_repo(request: Request) -> Repositorio:
+    return request.app.state.repo
+
+def get_senhas(request: Request) -> ServicoSenhas:
+    return request.app.state.senhas
+
+def get_catalogo(request: Request) -> CatalogoCache:
+    return request.app.state.catalogo
+
+def get_principais(request: Request) -> ResolvedorPrincipal:
+    return request.app.state.principais
+
+def get_historico(request: Request) -> Historico:
+    return request.app.state.historico
+
+def get_ranking_service(request: Request) -> Ranking:
+    return request.app.state.ranking
+
+def get_fila_escrita(request: Request) -> FilaEscrita:
+    return request.app.state.fila_escrita
+
+def get_sessao(request: Request) -> Sessao:
+    return request.app.state.sessao
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -80,82 +302,25 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+def decodificar_token(token: str) -> dict:
+    return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+# Retorna apenas email e username; rotas que precisam de mais campos buscam à parte
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    principais: ResolvedorPrincipal = Depends(get_principais)
+):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise HTTPException(status_code=401, detail="Token inválido")
+        user = await principais.resolver(token)
     except JWTError:
         raise HTTPException(status_code=401, detail="Token inválido")
-    
-    user = db.users.find_one({"email": email})
+
     if user is None:
         raise HTTPException(status_code=401, detail="Usuário não encontrado")
     return user
 
-async def inicializar_dados_padrao():
-    try:
-        print("🚀 Inicializando dados padrão...")
-
-        atividades_exemplo = [
-            {"_id": 1, "tipo": "letra", "conteudo": "A", "dica": "Qual é o som que essa letra faz?", "nivel": 1},
-            {"_id": 2, "tipo": "letra", "conteudo": "B", "dica": "Qual é o som que essa letra faz?", "nivel": 1},
-            {"_id": 3, "tipo": "letra", "conteudo": "C", "dica": "Qual é o som que essa letra faz?", "nivel": 1},
-            {"_id": 4, "tipo": "letra", "conteudo": "D", "dica": "Qual é o som que essa letra faz?", "nivel": 1},
-            {"_id": 5, "tipo": "letra", "conteudo": "E", "dica": "Qual é o som que essa letra faz?", "nivel": 1},
-
-            {"_id": 6, "tipo": "letra", "conteudo": "C _ S _", "dica": "Qual palavra pode ser formada aqui?", "nivel": 2},
-            {"_id": 7, "tipo": "letra", "conteudo": "P _ R _", "dica": "Qual palavra pode ser formada aqui?", "nivel": 2},
-            {"_id": 8, "tipo": "palavra", "conteudo": "O que é uma maçã?", "dica": "É uma fruta vermelha ou verde, doce e saudável.", "nivel": 2},
-            {"_id": 9, "tipo": "palavra", "conteudo": "O que é uma bola?", "dica": "É redonda e usamos para jogar.", "nivel": 2},
-            {"_id": 10, "tipo": "palavra", "conteudo": "O que é um cachorro?", "dica": "É um animal que ladra.", "nivel": 2},
-
-            {"_id": 11, "tipo": "silaba", "conteudo": "MAN e SÃO", "dica": "O que você forma ao juntar essas sílabas?", "nivel": 3},
-            {"_id": 12, "tipo": "silaba", "conteudo": "CA e SA", "dica": "O que você forma ao juntar essas sílabas?", "nivel": 3},
-            {"_id": 13, "tipo": "silaba", "conteudo": "BA e LA", "dica": "O que você forma ao juntar essas sílabas?", "nivel": 3},
-            {"_id": 14, "tipo": "silaba", "conteudo": "PA e RA", "dica": "O que você forma ao juntar essas sílabas?", "nivel": 3},
-            {"_id": 15, "tipo": "palavra", "conteudo": "O gato está no telhado.", "dica": "Onde está o gato?", "nivel": 3},
-
-            {"_id": 16, "tipo": "frase", "conteudo": "Eu vejo um ___.", "dica": "Complete a frase com um animal que você gosta.", "nivel": 4},
-            {"_id": 17, "tipo": "frase", "conteudo": "Hoje eu fui ao ___.", "dica": "Complete a frase com um lugar que você visita todo dia", "nivel": 4},
-            {"_id": 18, "tipo": "palavra", "conteudo": "O que é uma escola?", "dica": "É onde aprendemos, mas também pode ser um sinonimo.", "nivel": 4},
-            {"_id": 19, "tipo": "palavra", "conteudo": "O que é um livro?", "dica": "É onde encontramos histórias, onde lemos.", "nivel": 4},
-            {"_id": 20, "tipo": "letra", "conteudo": "A, B, C, D, E...", "dica": "Complete sua cartela com a ordem dessas letras.", "nivel": 4},
-        ]
-
-        for atividade in atividades_exemplo:
-            # Atualiza ou insere a atividade
-            db.atividades.update_one(
-                {"_id": atividade["_id"]},  # Filtra pela chave única
-                {"$set": atividade},        # Atualiza ou insere
-                upsert=True                 # Cria um novo documento se não existir
-            )
-
-        print(f"✅ {len(atividades_exemplo)} atividades atualizadas com sucesso!")
-
-    except Exception as e:
-        print(f"❌ Erro ao inicializar dados: {str(e)}")
-        raise e
-
-# Evento de inicialização do FastAPI
-@app.on_event("startup")
-async def startup_event():
-    print("🚀 Iniciando servidor...")
-    try:
-        # Teste a conexão com o MongoDB
-        client.admin.command('ping')
-        print("✅ Conectado ao MongoDB com sucesso!")
-        
-        # Inicializa os dados padrão
-        await inicializar_dados_padrao()
-        
-    except Exception as e:
-        print(f"❌ Erro na inicialização: {str(e)}")
-        raise e
-
 # Rotas
-@app.get("/", tags=["Root"])
+@app.get("/", tags=["Root"], response_model=Raiz)
 async def read_root():
     return {
         "message": "Bem-vindo à API de Alfabetização",
@@ -163,151 +328,308 @@ async def read_root():
         "endpoints": {
             "autenticação": ["/register", "/token"],
             "atividades": ["/atividades", "/inicializar-dados"],
-            "usuário": ["/user/progress"]
+            "usuário": ["/user/progress"],
+            "sessão": ["/session/bootstrap", "/session/sync"]
         }
     }
 
-@app.get("/health", tags=["Health Check"])
-async def health_check():
+@app.get("/health", tags=["Health Check"], response_model=Saude)
+async def health_check(
+    request: Request,
+    repo: Repositorio = Depends(get_repo),
+    senhas: ServicoSenhas = Depends(get_senhas)
+):
+    bootstrap = request.app.state.bootstrap
+    if not bootstrap.pronto:
+        return RespostaJSON(
+            status_code=503,
+            content={
+                "status": "unhealthy" if bootstrap.erro else "starting",
+                "error": bootstrap.erro,
+                "timestamp": datetime.utcnow()
+            }
+        )
     try:
-        client.admin.command('ping')
+        await repo.ping()
         return {
-            "status": "healthy",
+            "status": "degraded" if bootstrap.indices_com_erro else "healthy",
             "database": "connected",
-            "timestamp": datetime.utcnow().isoformat()
+            "senhas": senhas.estatisticas(),
+            "indices_com_erro": bootstrap.indices_com_erro,
+            "timestamp": datetime.utcnow()
         }
     except Exception as e:
-        return JSONResponse(
+        return RespostaJSON(
             status_code=500,
             content={
                 "status": "unhealthy",
                 "database": "disconnected",
                 "error": str(e),
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": datetime.utcnow()
             }
         )
 
-@app.post("/register", tags=["Autenticação"])
-async def register(user: UserCreate):
-    if db.users.find_one({"email": user.email}):
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    # Formato texto do Prometheus, somando todos os workers do gunicorn
+    return Response(content=exportar(), media_type=TIPO_CONTEUDO)
+
+@app.post("/register", tags=["Autenticação"], response_model=UsuarioCriado)
+async def register(
+    user: UserCreate,
+    repo: Repositorio = Depends(get_repo),
+    senhas: ServicoSenhas = Depends(get_senhas)
+):
+    if await repo.buscar_usuario(user.email, {"_id": 1}):
         raise HTTPException(status_code=400, detail="Email já registrado")
     
-    hashed_password = bcrypt.hashpw(user.password.encode('utf-8'), bcrypt.gensalt())
+    hashed_password = await senhas.gerar_hash(user.password)
     user_data = {
         "username": user.username,
         "email": user.email,
         "password": hashed_password,
-        "created_at": datetime.utcnow(),
-        "progress": []
+        "nivel": 1,
+        "created_at": datetime.utcnow()
     }
     
     try:
-        result = db.users.insert_one(user_data)
+        await repo.criar_usuario(user_data)
         return {
             "message": "Usuário criado com sucesso",
             "username": user.username,
             "email": user.email
         }
+    except DuplicateKeyError:
+        # Cadastro simultâneo com o mesmo email (índice único em users.email)
+        raise HTTPException(status_code=400, detail="Email já registrado")
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Erro ao criar usuário: {str(e)}"
         )
 
-@app.post("/token", tags=["Autenticação"])
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = db.users.find_one({"email": form_data.username})
-    if not user or not bcrypt.checkpw(form_data.password.encode('utf-8'), user["password"]):
+@app.post("/token", tags=["Autenticação"], response_model=Token)
+async def login(
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    repo: Repositorio = Depends(get_repo),
+    senhas: ServicoSenhas = Depends(get_senhas),
+    principais: ResolvedorPrincipal = Depends(get_principais)
+):
+    user = await repo.buscar_usuario(form_data.username, {"email": 1, "password": 1})
+    if not user or not await senhas.verificar(form_data.password, user["password"]):
         raise HTTPException(status_code=401, detail="Email ou senha incorretos")
-    
+
+    # Atualiza hashes antigos para o custo atual aproveitando a senha em texto
+    if senhas.precisa_atualizar(user["password"]):
+        try:
+            novo_hash = await senhas.gerar_hash(form_data.password)
+            await repo.atualizar_senha(user["email"], novo_hash)
+            principais.invalidar(user["email"])
+        except SobrecargaSenhas:
+            pass  # Fica para o próximo login
+
     access_token = create_access_token({"sub": user["email"]})
     return {"access_token": access_token, "token_type": "bearer"}
 
-@app.get("/atividades/", tags=["Atividades"])
-async def listar_atividades(nivel: int = 1):
+# Corpo já serializado pelo cache; o modelo só documenta o formato
+@app.get("/atividades/", tags=["Atividades"], response_model=AtividadesNivel)
+async def listar_atividades(
+    request: Request,
+    nivel: int = 1,
+    catalogo: CatalogoCache = Depends(get_catalogo)
+):
+    # Servido da memória; o cliente revalida com If-None-Match a cada uso
+    entrada = catalogo.obter(nivel)
+    headers = {"ETag": entrada.etag, "Cache-Control": "no-cache"}
+    if entrada.corresponde(request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entrada.corpo, media_type="application/json", headers=headers)
+
+async def _stream_progresso(username: str, primeiro, eventos):
+    # Envia o JSON aos poucos, conforme os lotes chegam do MongoDB; `primeiro` já foi lido pela rota
+    yield b'{"username":' + para_json(username) + b',"progress":['
+    separador = b""
+    evento, proximo_cursor = primeiro
+    while evento is not None:
+        yield separador + para_json(evento)
+        separador = b","
+        evento, proximo_cursor = await eventos.__anext__()
+    yield b'],"next_cursor":' + para_json(proximo_cursor) + b"}"
+
+# Transmitido em partes no formato de ProgressoPaginado
+@app.get("/user/progress", tags=["Usuário"], response_model=ProgressoPaginado)
+async def get_progress(
+    current_user: dict = Depends(get_current_user),
+    historico: Historico = Depends(get_historico),
+    cursor: Optional[str] = None,
+    limite: int = Query(100, ge=1, le=1000),
+    nivel: Optional[int] = None,
+    desde: Optional[datetime] = None,
+    ate: Optional[datetime] = None
+):
+    if cursor:
+        try:
+            decodificar_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+
+    eventos = historico.paginar(
+        current_user["email"], TIPO_PROGRESSO, limite,
+        cursor=cursor, nivel=nivel, desde=desde, ate=ate
+    )
+    # O primeiro lote é buscado antes de responder: uma falha aqui ainda vira 500,
+    # e não um 200 com o JSON cortado
     try:
-        atividades = list(db.atividades.find({"nivel": nivel}, {"_id": 0}))
-        return {
-            "nivel": nivel,
-            "total": len(atividades),
-            "atividades": atividades
-        }
+        primeiro = await eventos.__anext__()
     except Exception as e:
+        await eventos.aclose()
         raise HTTPException(
             status_code=500,
-            detail=f"Erro ao buscar atividades: {str(e)}"
+            detail=f"Erro ao buscar progresso: {str(e)}"
         )
-
-@app.get("/user/progress", tags=["Usuário"])
-async def get_progress(current_user: dict = Depends(get_current_user)):
-    return {
-        "username": current_user["username"],
-        "progress": current_user.get("progress", [])
-    }
-
-@app.get("/ranking", tags=["Ranking"])
-async def get_ranking():
+    return StreamingResponse(
+        _stream_progresso(current_user["username"], primeiro, eventos),
+        media_type="application/json"
+    )
+
+def _nome_quadro(nivel: Optional[int], periodo: Optional[str], catalogo: CatalogoCache) -> str:
+    if nivel is not None:
+        # Só níveis do catálogo: cada quadro pedido fica em memória no worker
+        if nivel not in catalogo.niveis():
+            raise HTTPException(status_code=404, detail="Nível não encontrado")
+        return quadro_nivel(nivel)
+    if periodo == "semana":
+        return quadro_semana(datetime.utcnow())
+    return QUADRO_GERAL
+
+@app.get("/ranking", tags=["Ranking"], response_model=RankingResposta)
+async def get_ranking(
+    response: Response,
+    ranking: Ranking = Depends(get_ranking_service),
+    catalogo: CatalogoCache = Depends(get_catalogo),
+    nivel: Optional[int] = Query(None, ge=1),
+    periodo: Optional[str] = Query(None, pattern="^semana$"),
+    limite: int = Query(10, ge=1, le=100)
+):
+    nome = _nome_quadro(nivel, periodo, catalogo)
     try:
-        # Busca todos os usuários e ordena por pontuação total
-        usuarios = list(db.users.find(
-            {},
-            {"_id": 0, "username": 1, "pontuacao_total": 1}
-        ).sort("pontuacao_total", -1).limit(10))  # -1 para ordem decrescente, top 10
-        
-        return {
-            "ranking": usuarios
-        }
+        # Top K do quadro em memória, sincronizado de forma incremental
+        quadro = await ranking.quadro(nome)
+        response.headers["Cache-Control"] = f"public, max-age={int(RANKING_INTERVALO)}"
+        return {"ranking": quadro.faixa(0, limite)}
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Erro ao buscar ranking: {str(e)}"
         )
 
-@app.post("/user/pontuacao", tags=["Usuário"])
+@app.get("/ranking/me", tags=["Ranking"], response_model=MinhaPosicao)
+async def get_my_ranking(
+    current_user: dict = Depends(get_current_user),
+    ranking: Ranking = Depends(get_ranking_service),
+    catalogo: CatalogoCache = Depends(get_catalogo),
+    nivel: Optional[int] = Query(None, ge=1),
+    periodo: Optional[str] = Query(None, pattern="^semana$"),
+    vizinhos: int = Query(2, ge=0, le=10)
+):
+    quadro = await ranking.quadro(_nome_quadro(nivel, periodo, catalogo))
+    posicao = quadro.posicao(current_user["email"])
+    if posicao is None:
+        return {"total": len(quadro), "vizinhos": []}
+    return {
+        "posicao": posicao + 1,
+        "pontuacao_total": quadro.pontuacao(current_user["email"]),
+        "total": len(quadro),
+        "vizinhos": quadro.faixa(posicao - vizinhos, posicao + vizinhos + 1)
+    }
+
+# Pontuação e progresso entram na fila de escrita do worker e são gravados em lote
+@app.post("/user/pontuacao", tags=["Usuário"], response_model=Mensagem)
 async def update_total_score(
     current_user: dict = Depends(get_current_user),
-    pontuacao: int = Body(..., embed=True)
+    pontuacao: int = Body(..., embed=True),
+    fila: FilaEscrita = Depends(get_fila_escrita)
 ):
-    try:
-        db.users.update_one(
-            {"email": current_user["email"]},
-            {
-                "$set": {"pontuacao_total": pontuacao},
-                "$push": {
-                    "historico_pontuacao": {
-                        "pontuacao": pontuacao,
-                        "data": datetime.utcnow()
-                    }
-                }
-            }
-        )
-        return {"message": "Pontuação atualizada com sucesso"}
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Erro ao atualizar pontuação: {str(e)}"
-        )
+    fila.pontuacao(current_user["email"], current_user["username"], pontuacao, datetime.utcnow())
+    return {"message": "Pontuação atualizada com sucesso"}
 
-@app.post("/user/progress", tags=["Usuário"])
+@app.post("/user/progress", tags=["Usuário"], response_model=Mensagem)
 async def update_progress(
     progress: ProgressUpdate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    fila: FilaEscrita = Depends(get_fila_escrita)
+):
+    fila.progresso(
+        current_user["email"], current_user["username"], progress.nivel, progress.pontuacao, datetime.utcnow()
+    )
+    return {"message": "Progresso atualizado com sucesso"}
+
+def _utc(data: datetime) -> datetime:
+    # Datas com fuso viram UTC sem fuso, como as gravadas pelo servidor
+    if data.tzinfo is not None:
+        data = data.astimezone(timezone.utc).replace(tzinfo=None)
+    return data
+
+# Sincronização de eventos acumulados offline; ids repetidos são ignorados
+@app.post("/user/events", tags=["Usuário"], response_model=EventosRegistrados)
+async def submit_events(
+    lote: EventosUsuario,
+    current_user: dict = Depends(get_current_user),
+    repo: Repositorio = Depends(get_repo),
+    fila: FilaEscrita = Depends(get_fila_escrita)
 ):
+    for evento in lote.eventos:
+        if evento.tipo == TIPO_PROGRESSO and evento.nivel is None:
+            raise HTTPException(status_code=422, detail=f"Evento {evento.id}: nivel é obrigatório para progress")
+
+    # Último evento com cada id dentro do próprio lote
+    por_id = {evento.id: evento for evento in lote.eventos}
+    chaves = list(por_id)
+    email = current_user["email"]
     try:
-        db.users.update_one(
-            {"email": current_user["email"]},
-            {"$push": {"progress": {
-                "nivel": progress.nivel,
-                "pontuacao": progress.pontuacao,
-                "data": datetime.utcnow()
-            }}}
-        )
-        return {"message": "Progresso atualizado com sucesso"}
+        duplicados = await repo.registrar_chaves(email, chaves)
+        novos = [por_id[chave] for chave in chaves if chave not in duplicados]
+        agora = datetime.utcnow()
+        try:
+            await fila.gravar_agora(email, current_user["username"], [
+                # Datas no futuro (relógio do dispositivo adiantado) viram o horário do servidor
+                (e.id, e.tipo, e.nivel, e.pontuacao, min(_utc(e.data), agora) if e.data else agora)
+                for e in novos
+            ])
+        except Exception:
+            # Nada foi gravado: libera as chaves para o cliente poder reenviar.
+            # Gravações parciais não chegam aqui; o restante fica na fila
+            await repo.remover_chaves(email, [e.id for e in novos])
+            raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
-            detail=f"Erro ao atualizar progresso: {str(e)}"
+            detail=f"Erro ao registrar eventos: {str(e)}"
         )
+    return {
+        "message": "Eventos registrados com sucesso",
+        "aceitos": len(novos),
+        "duplicados": sorted(duplicados)
+    }
+
+# Início de sessão do jogo: usuário, catálogo inteiro e ranking em uma só resposta
+@app.get("/session/bootstrap", tags=["Sessão"], response_model=EstadoSessao)
+async def session_bootstrap(
+    current_user: dict = Depends(get_current_user),
+    sessao: Sessao = Depends(get_sessao),
+    limite: int = Query(10, ge=1, le=100)
+):
+    return await sessao.montar(current_user, limite)
+
+@app.get("/session/sync", tags=["Sessão"], response_model=EstadoSessao)
+async def session_sync(
+    since: int = Query(..., ge=0),
+    catalogo: Optional[int] = Query(None, ge=0),
+    current_user: dict = Depends(get_current_user),
+    sessao: Sessao = Depends(get_sessao),
+    limite: int = Query(10, ge=1, le=100)
+):
+    return await sessao.montar(current_user, limite, desde=since, catalogo=catalogo)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,204 @@
+from typing import Dict, Any
+import asyncio
+import os
+import time
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest,
+)
+from prometheus_client import multiprocess, values
+from pymongo import monitoring
+
+from logs import get_logger
+
+logger = get_logger("metricas")
+
+# Com PROMETHEUS_MULTIPROC_DIR definido (ver gunicorn.conf.py), cada worker grava
+# seus valores em arquivos nesse diretório e /metrics soma todos eles
+MULTIPROCESSO = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+# Se o prometheus_client foi importado antes da variável existir, os valores
+# ficam só na memória do processo e /metrics sai vazio; melhor falhar já
+if MULTIPROCESSO and values.ValueClass is values.MutexValue:
+    raise RuntimeError(
+        "prometheus_client importado antes de PROMETHEUS_MULTIPROC_DIR ser definido; "
+        "defina a variável antes de qualquer import do prometheus_client"
+    )
+
+MONGODB_LENTO_MS = float(os.getenv("MONGODB_LENTO_MS", "100"))
+LOOP_INTERVALO = float(os.getenv("LOOP_INTERVALO", "0.5"))
+LOOP_LAG_ALERTA = float(os.getenv("LOOP_LAG_ALERTA", "0.1"))
+
+BALDES_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+REQUISICOES = Counter(
+    "http_requests_total", "Requisições HTTP atendidas", ["metodo", "rota", "status"]
+)
+DURACAO_REQUISICAO = Histogram(
+    "http_request_duration_seconds", "Duração das requisições HTTP", ["metodo", "rota"], buckets=BALDES_SEGUNDOS
+)
+DURACAO_MONGODB = Histogram(
+    "mongodb_command_duration_seconds", "Duração dos comandos MongoDB", ["colecao", "operacao"], buckets=BALDES_SEGUNDOS
+)
+FALHAS_MONGODB = Counter(
+    "mongodb_command_failures_total", "Comandos MongoDB que falharam", ["colecao", "operacao"]
+)
+CONEXOES_MONGODB = Gauge(
+    "mongodb_pool_connections", "Conexões do pool do MongoDB", ["estado"], multiprocess_mode="livesum"
+)
+ESPERAS_POOL = Counter(
+    "mongodb_pool_checkout_failures_total", "Falhas ao obter conexão do pool", ["motivo"]
+)
+LAG_LOOP = Histogram(
+    "event_loop_lag_seconds", "Atraso do event loop em relação ao agendado", buckets=BALDES_SEGUNDOS
+)
+LAG_LOOP_ATUAL = Gauge(
+    "event_loop_lag_current_seconds", "Último atraso medido do event loop", multiprocess_mode="livemax"
+)
+FILA_SENHAS = Gauge(
+    "bcrypt_queue_depth", "Hashes de senha aguardando ou executando", multiprocess_mode="livesum"
+)
+DURACAO_SENHAS = Histogram(
+    "bcrypt_duration_seconds", "Duração de cada hash/verificação bcrypt", ["operacao"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+SENHAS_REJEITADAS = Counter(
+    "bcrypt_rejected_total", "Pedidos de hash recusados com 503 por fila cheia"
+)
+
+
+def exportar() -> bytes:
+    if MULTIPROCESSO:
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+        return generate_latest(registro)
+    return generate_latest(REGISTRY)
+
+
+TIPO_CONTEUDO = CONTENT_TYPE_LATEST  # Formato texto do Prometheus
+
+
+class MetricasMiddleware:
+    """Middleware ASGI que conta e cronometra as requisições por rota.
+
+    Usa o caminho declarado da rota (ex: /ranking/me), não a URL, para não
+    criar uma série por parâmetro; requisições sem rota viram "desconhecida".
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._rotas: Dict[Any, str] = {}
+
+    def _rota(self, scope) -> str:
+        # O roteador grava a função da rota em scope["endpoint"]
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "desconhecida"
+        if not self._rotas:
+            self._rotas = {r.endpoint: r.path for r in scope["app"].routes if hasattr(r, "endpoint")}
+        return self._rotas.get(endpoint, "desconhecida")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"codigo": 500}
+
+        async def enviar(mensagem):
+            if mensagem["type"] == "http.response.start":
+                status["codigo"] = mensagem["status"]
+            await send(mensagem)
+
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            duracao = time.perf_counter() - inicio
+            rota = self._rota(scope)
+            DURACAO_REQUISICAO.labels(scope["method"], rota).observe(duracao)
+            REQUISICOES.labels(scope["method"], rota, str(status["codigo"])).inc()
+
+
+class OuvinteComandos(monitoring.CommandListener):
+    """Cronometra os comandos enviados ao MongoDB e registra os lentos."""
+
+    def __init__(self):
+        self._colecoes: Dict[Any, str] = {}
+
+    def _colecao(self, event) -> str:
+        return self._colecoes.pop((event.connection_id, event.request_id), "-")
+
+    def started(self, event):
+        colecao = event.command.get(event.command_name)
+        if not isinstance(colecao, str):
+            colecao = "-"
+        self._colecoes[(event.connection_id, event.request_id)] = colecao
+
+    def succeeded(self, event):
+        colecao = self._colecao(event)
+        duracao = event.duration_micros / 1_000_000
+        DURACAO_MONGODB.labels(colecao, event.command_name).observe(duracao)
+        if duracao * 1000 >= MONGODB_LENTO_MS:
+            logger.warning("Comando MongoDB lento", extra={
+                "colecao": colecao, "operacao": event.command_name, "duracao_ms": round(duracao * 1000, 1),
+            })
+
+    def failed(self, event):
+        colecao = self._colecao(event)
+        DURACAO_MONGODB.labels(colecao, event.command_name).observe(event.duration_micros / 1_000_000)
+        FALHAS_MONGODB.labels(colecao, event.command_name).inc()
+
+
+class OuvintePool(monitoring.ConnectionPoolListener):
+    """Mantém os gauges de conexões abertas e em uso do pool."""
+
+    def connection_created(self, event):
+        CONEXOES_MONGODB.labels("abertas").inc()
+
+    def connection_closed(self, event):
+        CONEXOES_MONGODB.labels("abertas").dec()
+
+    def connection_checked_out(self, event):
+        CONEXOES_MONGODB.labels("em_uso").inc()
+
+    def connection_checked_in(self, event):
+        CONEXOES_MONGODB.labels("em_uso").dec()
+
+    def connection_check_out_failed(self, event):
+        ESPERAS_POOL.labels(str(event.reason)).inc()
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+
+def ouvintes_mongodb():
+    return [OuvinteComandos(), OuvintePool()]
+
+
+async def medir_lag_loop(intervalo: float = LOOP_INTERVALO):
+    # Dorme um intervalo fixo; o que passar disso é tempo em que o loop ficou bloqueado
+    loop = asyncio.get_running_loop()
+    while True:
+        inicio = loop.time()
+        await asyncio.sleep(intervalo)
+        lag = max(0.0, loop.time() - inicio - intervalo)
+        LAG_LOOP.observe(lag)
+        LAG_LOOP_ATUAL.set(lag)
+        if lag >= LOOP_LAG_ALERTA:
+            logger.warning("Event loop bloqueado", extra={"lag_ms": round(lag * 1000, 1)})
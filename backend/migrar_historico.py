@@ -0,0 +1,92 @@
+"""Move os arrays `progress` e `historico_pontuacao` de `users` para a coleção `historico`.
+
+Uso:
+    python migrar_historico.py [--lote 500]
+
+Processa os usuários em lotes: apaga buckets de uma execução anterior
+interrompida, insere os novos buckets, remove os arrays do documento e
+grava em `nivel` o maior nível do progresso migrado.
+Em seguida recria o quadro geral do ranking a partir de `pontuacao_total`.
+Pode ser executado de novo com segurança.
+"""
+from typing import List, Dict, Any
+import argparse
+import asyncio
+
+from pymongo import UpdateOne
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from database import Repositorio, conectar
+from bootstrap import Bootstrap
+from historico import Historico, TIPO_PROGRESSO, TIPO_PONTUACAO
+from ranking import Ranking
+
+CAMPOS = {"progress": TIPO_PROGRESSO, "historico_pontuacao": TIPO_PONTUACAO}
+
+
+async def _aplicar_lote(repo: Repositorio, historico: Historico, usuarios: List[Dict[str, Any]]) -> int:
+    emails = [u["email"] for u in usuarios]
+    buckets = []
+    for usuario in usuarios:
+        for campo, tipo in CAMPOS.items():
+            eventos = [e for e in usuario.get(campo) or [] if e.get("data") is not None]
+            buckets.extend(historico.buckets(usuario["email"], tipo, eventos, migrado=True))
+
+    await historico.colecao.delete_many({"usuario": {"$in": emails}, "migrado": True})
+    if buckets:
+        await historico.colecao.insert_many(buckets, ordered=False)
+    # Remove os arrays e já grava o nível alcançado, para a fila de escrita só precisar subi-lo
+    operacoes = []
+    for usuario in usuarios:
+        atualizacao: Dict[str, Any] = {"$unset": {campo: "" for campo in CAMPOS}}
+        niveis = [e["nivel"] for e in usuario.get("progress") or [] if e.get("nivel") is not None]
+        if niveis:
+            atualizacao["$max"] = {"nivel": max(niveis)}
+        operacoes.append(UpdateOne({"email": usuario["email"]}, atualizacao))
+    await repo.gravar_usuarios(operacoes, ordered=False)
+    return len(buckets)
+
+
+async def migrar(repo: Repositorio, lote: int = 500):
+    historico = Historico(repo)
+    await Bootstrap(repo).executar()
+
+    cursor = repo.usuarios_com_campos(list(CAMPOS), lote)
+
+    total_usuarios = 0
+    total_buckets = 0
+    pendentes: List[Dict[str, Any]] = []
+    async for usuario in cursor:
+        pendentes.append(usuario)
+        if len(pendentes) >= lote:
+            total_buckets += await _aplicar_lote(repo, historico, pendentes)
+            total_usuarios += len(pendentes)
+            print(f"… {total_usuarios} usuários migrados")
+            pendentes = []
+    if pendentes:
+        total_buckets += await _aplicar_lote(repo, historico, pendentes)
+        total_usuarios += len(pendentes)
+
+    print(f"✅ {total_usuarios} usuários migrados em {total_buckets} buckets")
+
+    ranking = Ranking(repo)
+    total_ranking = await ranking.reconstruir_geral(repo, lote)
+    print(f"✅ {total_ranking} usuários no ranking geral")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lote", type=int, default=500, help="usuários por lote")
+    args = parser.parse_args()
+
+    repo = await conectar()
+    try:
+        await migrar(repo, args.lote)
+    finally:
+        repo.fechar()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,89 @@
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Callable
+import os
+import time
+
+from jose import JWTError
+
+from database import Repositorio
+
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_MAX = int(os.getenv("PRINCIPAL_CACHE_MAX", "10000"))
+
+# Só o necessário para identificar o usuário nas rotas
+PROJECAO_PRINCIPAL = {"_id": 0, "email": 1, "username": 1}
+
+
+class CacheTTL:
+    """Dicionário LRU limitado em que cada entrada expira após um prazo."""
+
+    def __init__(self, tamanho_max: int, ttl: float):
+        self.tamanho_max = tamanho_max
+        self.ttl = ttl
+        self._itens: "OrderedDict[Any, tuple]" = OrderedDict()
+
+    def obter(self, chave):
+        item = self._itens.get(chave)
+        if item is None:
+            return None
+        expira_em, valor = item
+        if expira_em <= time.monotonic():
+            del self._itens[chave]
+            return None
+        self._itens.move_to_end(chave)
+        return valor
+
+    def guardar(self, chave, valor, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self._itens[chave] = (time.monotonic() + ttl, valor)
+        self._itens.move_to_end(chave)
+        while len(self._itens) > self.tamanho_max:
+            self._itens.popitem(last=False)
+
+    def remover(self, chave):
+        self._itens.pop(chave, None)
+
+    def __len__(self):
+        return len(self._itens)
+
+
+class ResolvedorPrincipal:
+    """Transforma um token JWT no usuário autenticado com o mínimo de trabalho.
+
+    Guarda os tokens já decodificados (até o prazo do próprio token) e os
+    registros enxutos dos usuários (email e username), carregados com
+    projeção. Quem alterar esses campos deve chamar invalidar(email).
+    """
+
+    def __init__(self, repo: Repositorio, decodificar: Callable[[str], Dict[str, Any]],
+                 ttl: float = PRINCIPAL_CACHE_TTL, tamanho_max: int = PRINCIPAL_CACHE_MAX):
+        self.repo = repo
+        self._decodificar = decodificar
+        self._tokens = CacheTTL(tamanho_max, ttl)
+        self._usuarios = CacheTTL(tamanho_max, ttl)
+
+    def _email_do_token(self, token: str) -> str:
+        email = self._tokens.obter(token)
+        if email is not None:
+            return email
+        # Pode lançar JWTError; tokens inválidos não são guardados
+        payload = self._decodificar(token)
+        email = payload.get("sub")
+        if email is None:
+            raise JWTError("Token sem sub")
+        restante = payload["exp"] - time.time() if "exp" in payload else None
+        self._tokens.guardar(token, email, restante)
+        return email
+
+    async def resolver(self, token: str) -> Optional[Dict[str, Any]]:
+        email = self._email_do_token(token)
+        usuario = self._usuarios.obter(email)
+        if usuario is None:
+            usuario = await self.repo.buscar_usuario(email, PROJECAO_PRINCIPAL)
+            if usuario is None:
+                return None
+            self._usuarios.guardar(email, usuario)
+        return usuario
+
+    def invalidar(self, email: str):
+        self._usuarios.remover(email)
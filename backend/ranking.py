@@ -0,0 +1,212 @@
+from bisect import bisect_left
+from typing import Optional, Dict, Any, List, Tuple, NamedTuple
+from datetime import datetime, timedelta
+import asyncio
+import os
+import time
+
+from pymongo import UpdateOne
+
+from database import Repositorio
+
+# Intervalo mínimo entre sincronizações de um quadro com o MongoDB
+RANKING_INTERVALO = float(os.getenv("RANKING_INTERVALO", "5"))
+# Sobreposição na busca incremental para tolerar relógios diferentes entre servidores
+RANKING_FOLGA = float(os.getenv("RANKING_FOLGA", "5"))
+
+QUADRO_GERAL = "geral"
+# Posições acompanhadas por Quadro.topo_alterado_em (maior `limite` aceito em /ranking)
+RANKING_TOPO = 100
+
+
+def quadro_semana(data: datetime) -> str:
+    ano, semana, _ = data.isocalendar()
+    return f"semana:{ano}-W{semana:02d}"
+
+
+def quadro_nivel(nivel: int) -> str:
+    return f"nivel:{nivel}"
+
+
+class Atualizacao(NamedTuple):
+    quadro: str
+    email: str
+    username: str
+    pontuacao: int
+    data: datetime
+    # True: guarda a maior pontuação; False: a última enviada
+    maximo: bool
+
+    def operacao(self) -> UpdateOne:
+        # `atualizado` é a hora da gravação (não a do evento): guia a sincronização incremental
+        campos = {"quadro": self.quadro, "email": self.email, "username": self.username,
+                  "atualizado": datetime.utcnow()}
+        if self.maximo:
+            atualizacao = {"$set": campos, "$max": {"pontuacao": self.pontuacao}}
+        else:
+            atualizacao = {"$set": {**campos, "pontuacao": self.pontuacao}}
+        return UpdateOne({"_id": f"{self.quadro}|{self.email}"}, atualizacao, upsert=True)
+
+
+class Quadro:
+    """Classificação de um quadro em memória, ordenada por pontuação.
+
+    A posição de um usuário sai de uma busca binária na lista ordenada;
+    empates são desempatados pelo email para a ordem ser estável.
+    """
+
+    def __init__(self, nome: str):
+        self.nome = nome
+        self.marca: Optional[datetime] = None
+        self.sincronizado_em = 0.0
+        self.lock = asyncio.Lock()
+        # Hora (epoch) da última mudança nas RANKING_TOPO primeiras posições
+        self.topo_alterado_em = time.time()
+        self._usuarios: Dict[str, Tuple[int, str]] = {}
+        self._ordem: List[Tuple[int, str]] = []
+
+    def aplicar(self, email: str, username: str, pontuacao: int):
+        anterior = self._usuarios.get(email)
+        mudou = RANKING_TOPO
+        if anterior is not None:
+            if anterior[0] == pontuacao:
+                self._usuarios[email] = (pontuacao, username)
+                return
+            mudou = bisect_left(self._ordem, (-anterior[0], email))
+            del self._ordem[mudou]
+        self._usuarios[email] = (pontuacao, username)
+        item = (-pontuacao, email)
+        i = bisect_left(self._ordem, item)
+        self._ordem.insert(i, item)
+        if min(mudou, i) < RANKING_TOPO:
+            self.topo_alterado_em = time.time()
+
+    def pontuacao(self, email: str) -> Optional[int]:
+        item = self._usuarios.get(email)
+        return item[0] if item else None
+
+    def posicao(self, email: str) -> Optional[int]:
+        """Posição (a partir de 0) do usuário, ou None se ele não pontuou."""
+        item = self._usuarios.get(email)
+        if item is None:
+            return None
+        return bisect_left(self._ordem, (-item[0], email))
+
+    def faixa(self, inicio: int, fim: int) -> List[Dict[str, Any]]:
+        return [
+            {"posicao": i + 1, "username": self._usuarios[email][1], "pontuacao_total": -negativo}
+            for i, (negativo, email) in enumerate(self._ordem[max(0, inicio):fim], start=max(0, inicio))
+        ]
+
+    def __len__(self):
+        return len(self._ordem)
+
+
+class Ranking:
+    """Quadros de classificação mantidos de forma incremental.
+
+    A coleção `ranking` guarda um documento por quadro e usuário, com índice
+    por (quadro, pontuacao). Cada worker carrega um quadro quando ele é pedido
+    pela primeira vez e depois só busca os documentos alterados desde a
+    última sincronização (campo `atualizado`).
+    """
+
+    def __init__(self, repo: Repositorio, intervalo: float = RANKING_INTERVALO):
+        self.colecao = repo.db.ranking
+        self.intervalo = intervalo
+        self._quadros: Dict[str, Quadro] = {}
+        self._carregando: Dict[str, asyncio.Lock] = {}
+
+    def atualizacoes_pontuacao(self, email: str, username: str, pontuacao: int,
+                               data: datetime) -> List[Atualizacao]:
+        # Geral: última pontuação enviada; semanal: melhor pontuação da semana
+        return [
+            Atualizacao(QUADRO_GERAL, email, username, pontuacao, data, maximo=False),
+            Atualizacao(quadro_semana(data), email, username, pontuacao, data, maximo=True),
+        ]
+
+    def atualizacoes_nivel(self, email: str, username: str, nivel: int, pontuacao: int,
+                           data: datetime) -> List[Atualizacao]:
+        return [Atualizacao(quadro_nivel(nivel), email, username, pontuacao, data, maximo=True)]
+
+    def aplicar_local(self, atualizacoes: List[Atualizacao]):
+        # Reflete a escrita nos quadros já carregados neste worker
+        for atualizacao in atualizacoes:
+            quadro = self._quadros.get(atualizacao.quadro)
+            if quadro is None:
+                continue
+            atual = quadro.pontuacao(atualizacao.email)
+            if atualizacao.maximo and atual is not None and atual >= atualizacao.pontuacao:
+                continue
+            quadro.aplicar(atualizacao.email, atualizacao.username, atualizacao.pontuacao)
+
+    async def registrar(self, atualizacoes: List[Atualizacao]):
+        if atualizacoes:
+            await self.colecao.bulk_write([a.operacao() for a in atualizacoes], ordered=True)
+            self.aplicar_local(atualizacoes)
+
+    async def quadro(self, nome: str) -> Quadro:
+        quadro = self._quadros.get(nome)
+        if quadro is None:
+            return await self._carregar(nome)
+        if time.monotonic() - quadro.sincronizado_em >= self.intervalo:
+            async with quadro.lock:
+                if time.monotonic() - quadro.sincronizado_em >= self.intervalo:
+                    await self._sincronizar(quadro)
+        return quadro
+
+    async def _carregar(self, nome: str) -> Quadro:
+        # Um carregamento por quadro; quem chegar durante a busca espera por ele
+        lock = self._carregando.setdefault(nome, asyncio.Lock())
+        try:
+            async with lock:
+                quadro = self._quadros.get(nome)
+                if quadro is not None:
+                    return quadro
+                quadro = Quadro(nome)
+                await self._sincronizar(quadro)
+                if not len(quadro):
+                    # Quadro vazio não fica em memória; é buscado de novo no próximo pedido
+                    return quadro
+                if nome.startswith("semana:"):
+                    # Só a semana corrente fica em memória
+                    for antigo in [q for q in self._quadros if q.startswith("semana:")]:
+                        del self._quadros[antigo]
+                self._quadros[nome] = quadro
+                return quadro
+        finally:
+            if not lock.locked():
+                self._carregando.pop(nome, None)
+
+    async def _sincronizar(self, quadro: Quadro):
+        filtro: Dict[str, Any] = {"quadro": quadro.nome}
+        if quadro.marca is not None:
+            filtro["atualizado"] = {"$gte": quadro.marca - timedelta(seconds=RANKING_FOLGA)}
+        cursor = self.colecao.find(
+            filtro,
+            {"_id": 0, "email": 1, "username": 1, "pontuacao": 1, "atualizado": 1}
+        )
+        async for doc in cursor:
+            quadro.aplicar(doc["email"], doc.get("username", ""), doc["pontuacao"])
+            if quadro.marca is None or doc["atualizado"] > quadro.marca:
+                quadro.marca = doc["atualizado"]
+        quadro.sincronizado_em = time.monotonic()
+
+    async def reconstruir_geral(self, repo: Repositorio, lote: int = 1000) -> int:
+        """Recria o quadro geral a partir de users.pontuacao_total."""
+        agora = datetime.utcnow()
+        total = 0
+        operacoes = []
+        async for usuario in repo.usuarios_com_pontuacao(lote):
+            operacoes.append(Atualizacao(
+                QUADRO_GERAL, usuario["email"], usuario.get("username", ""),
+                usuario["pontuacao_total"], agora, maximo=False
+            ).operacao())
+            if len(operacoes) >= lote:
+                await self.colecao.bulk_write(operacoes, ordered=False)
+                total += len(operacoes)
+                operacoes = []
+        if operacoes:
+            await self.colecao.bulk_write(operacoes, ordered=False)
+            total += len(operacoes)
+        return total
@@ -0,0 +1,28 @@
+from typing import Any
+
+import orjson
+from bson import ObjectId
+from fastapi.responses import ORJSONResponse
+
+
+def _padrao(obj: Any) -> Any:
+    # orjson já codifica datetime, UUID e dataclasses; falta o ObjectId do MongoDB
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    raise TypeError(f"Tipo não serializável em JSON: {type(obj).__name__}")
+
+
+def para_json(conteudo: Any) -> bytes:
+    return orjson.dumps(conteudo, default=_padrao, option=orjson.OPT_NON_STR_KEYS)
+
+
+class RespostaJSON(ORJSONResponse):
+    """Resposta padrão da API, codificada com orjson.
+
+    Rotas com `response_model` chegam aqui já validadas e convertidas pelo
+    pydantic; as demais (erros, /health) podem passar datetime e ObjectId
+    diretamente.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return para_json(content)
@@ -0,0 +1,121 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any
+import asyncio
+import math
+import os
+import threading
+import time
+
+import bcrypt
+
+from metricas import FILA_SENHAS, DURACAO_SENHAS, SENHAS_REJEITADAS
+
+# Custo do bcrypt (2^rounds iterações) e tamanho do pool de hashing
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", str(os.cpu_count() or 1)))
+# Quantos pedidos podem esperar na fila além dos que já estão executando
+BCRYPT_MAX_FILA = int(os.getenv("BCRYPT_MAX_FILA", "64"))
+
+
+class SobrecargaSenhas(Exception):
+    """Fila de hashing cheia: o pedido deve ser repetido depois de retry_after segundos."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Fila de hashing de senhas cheia")
+        self.retry_after = retry_after
+
+
+class ServicoSenhas:
+    """Hash e verificação de senhas com bcrypt fora do event loop.
+
+    O bcrypt libera o GIL durante o cálculo, então um pool de threads do
+    tamanho dos núcleos executa os hashes em paralelo sem travar as outras
+    requisições do worker. Quando a fila enche, o pedido é recusado na hora
+    (SobrecargaSenhas) em vez de esperar indefinidamente.
+    """
+
+    def __init__(self, rounds: int = BCRYPT_ROUNDS, workers: int = BCRYPT_WORKERS,
+                 max_fila: int = BCRYPT_MAX_FILA):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_fila = max_fila
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._pendentes = 0
+        self._em_execucao = 0
+        self._lock = threading.Lock()
+        self._rejeitadas = 0
+        self._total = 0
+        self._tempo_total = 0.0
+        self._tempo_max = 0.0
+
+    def fechar(self):
+        self._executor.shutdown(wait=True)
+
+    def _executar(self, funcao, *args):
+        # Roda na thread do pool; as estatísticas agregadas ficam no event loop
+        with self._lock:
+            self._em_execucao += 1
+        inicio = time.perf_counter()
+        try:
+            return funcao(*args), time.perf_counter() - inicio
+        finally:
+            with self._lock:
+                self._em_execucao -= 1
+
+    def _retry_after(self) -> int:
+        media = self._tempo_total / self._total if self._total else 0.25
+        return max(1, math.ceil(self._pendentes * media / self.workers))
+
+    def _liberar(self, _futuro):
+        # Chamado quando o pool termina ou descarta o trabalho, em qualquer thread
+        with self._lock:
+            self._pendentes -= 1
+        FILA_SENHAS.dec()
+
+    async def _submeter(self, operacao: str, funcao, *args):
+        with self._lock:
+            cheia = self._pendentes >= self.workers + self.max_fila
+            if not cheia:
+                self._pendentes += 1
+        if cheia:
+            self._rejeitadas += 1
+            SENHAS_REJEITADAS.inc()
+            raise SobrecargaSenhas(self._retry_after())
+        FILA_SENHAS.inc()
+        futuro = self._executor.submit(self._executar, funcao, *args)
+        # O contador baixa quando o trabalho sai do pool, não quando quem espera é
+        # cancelado (cliente desconectado, timeout do proxy): o hash continua na fila
+        futuro.add_done_callback(self._liberar)
+        resultado, duracao = await asyncio.wrap_future(futuro)
+        DURACAO_SENHAS.labels(operacao).observe(duracao)
+        self._total += 1
+        self._tempo_total += duracao
+        self._tempo_max = max(self._tempo_max, duracao)
+        return resultado
+
+    async def gerar_hash(self, senha: str) -> bytes:
+        return await self._submeter("hash", self._hash, senha.encode("utf-8"))
+
+    async def verificar(self, senha: str, hashed: bytes) -> bool:
+        return await self._submeter("verificar", bcrypt.checkpw, senha.encode("utf-8"), hashed)
+
+    def _hash(self, senha: bytes) -> bytes:
+        return bcrypt.hashpw(senha, bcrypt.gensalt(rounds=self.rounds))
+
+    def precisa_atualizar(self, hashed: bytes) -> bool:
+        # Formato: $2b$<rounds>$<salt+hash>
+        try:
+            return int(hashed.split(b"$")[2]) < self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def estatisticas(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "fila": max(0, self._pendentes - self._em_execucao),
+            "em_execucao": self._em_execucao,
+            "rejeitadas": self._rejeitadas,
+            "hashes": self._total,
+            "latencia_media_ms": round(1000 * self._tempo_total / self._total, 2) if self._total else 0.0,
+            "latencia_max_ms": round(1000 * self._tempo_max, 2),
+        }
@@ -0,0 +1,95 @@
+from typing import Optional, Dict, Any
+from datetime import datetime, timezone
+import asyncio
+import os
+import time
+
+from database import Repositorio
+from catalogo import CatalogoCache
+from historico import Historico
+from ranking import Ranking, QUADRO_GERAL, RANKING_INTERVALO
+
+# Folga (segundos) aplicada a `since` para tolerar relógios diferentes entre servidores
+SESSAO_FOLGA = float(os.getenv("SESSAO_FOLGA", "5"))
+
+PROJECAO_ESTADO = {"_id": 0, "nivel": 1, "pontuacao_total": 1, "atualizado": 1}
+
+
+def _epoch(data: Optional[datetime]) -> float:
+    # Datas sem fuso são UTC, como as gravadas pela fila de escrita
+    if data is None:
+        return 0.0
+    if data.tzinfo is None:
+        data = data.replace(tzinfo=timezone.utc)
+    return data.timestamp()
+
+
+class Sessao:
+    """Estado inicial do jogo em uma única resposta e sincronização por versão.
+
+    A versão é um instante em milissegundos, crescente em cada worker.
+    Usuário (`users.atualizado`) e o topo do ranking guardam a hora da
+    última mudança; a sincronização devolve só as partes alteradas depois
+    da versão recebida, menos SESSAO_FOLGA (e, no ranking, menos o atraso
+    máximo de um quadro em outro worker). O catálogo usa a própria versão,
+    comum a todos os workers: o cliente devolve a que recebeu e volta cada
+    nível alterado depois dela. Na dúvida uma parte é reenviada, nunca omitida.
+    """
+
+    def __init__(self, repo: Repositorio, historico: Historico, catalogo: CatalogoCache, ranking: Ranking):
+        self.repo = repo
+        self.historico = historico
+        self.catalogo = catalogo
+        self.ranking = ranking
+        self._ultima_versao = 0
+
+    def _versao(self) -> int:
+        versao = max(int(time.time() * 1000), self._ultima_versao + 1)
+        self._ultima_versao = versao
+        return versao
+
+    async def _estado_usuario(self, email: str) -> Dict[str, Any]:
+        estado = await self.repo.buscar_usuario(email, PROJECAO_ESTADO) or {}
+        if estado.get("nivel") is None:
+            # Contas anteriores ao campo `nivel`: calcula pelo histórico uma vez e grava
+            nivel = await self.historico.maior_nivel(email)
+            if nivel is not None:
+                estado["atualizado"] = await self.repo.completar_nivel(email, nivel)
+            estado["nivel"] = nivel
+        return estado
+
+    async def montar(self, usuario: Dict[str, Any], top_k: int, desde: Optional[int] = None,
+                     catalogo: Optional[int] = None) -> Dict[str, Any]:
+        """Estado completo (desde=None) ou só o que mudou depois da versão `desde`.
+
+        `catalogo` é a versão do catálogo recebida na resposta anterior; sem
+        ela todos os níveis são enviados.
+        """
+        # A versão é tirada antes das leituras: o que mudar durante elas volta na próxima sincronização
+        versao = self._versao()
+        estado, quadro = await asyncio.gather(
+            self._estado_usuario(usuario["email"]),
+            self.ranking.quadro(QUADRO_GERAL),
+        )
+        limite = float("-inf") if desde is None else desde / 1000 - SESSAO_FOLGA
+
+        resultado: Dict[str, Any] = {
+            "versao": versao,
+            "completo": desde is None,
+            # Lidos juntos, sem await entre eles: a versão corresponde aos níveis enviados
+            "catalogo": self.catalogo.versao or 0,
+            "atividades": {
+                nivel: entrada.atividades
+                for nivel, entrada in self.catalogo.alterados_desde(None if desde is None else catalogo).items()
+            },
+        }
+        if _epoch(estado.get("atualizado")) > limite:
+            resultado["usuario"] = {
+                "username": usuario["username"],
+                "nivel": estado.get("nivel") or 1,
+                "pontuacao_total": estado.get("pontuacao_total") or 0,
+            }
+        # Outro worker pode ter servido o quadro com até RANKING_INTERVALO de atraso
+        if quadro.topo_alterado_em > limite - RANKING_INTERVALO:
+            resultado["ranking"] = quadro.faixa(0, top_k)
+        return resultado
@@ -0,0 +1,67 @@
+"""Fixtures comuns: MongoDB em memória (mongomock_motor) e a API em processo.
+
+Os testes são funções síncronas que executam um cenário assíncrono com
+`asyncio.run`, como os scripts de bench/.
+"""
+from contextlib import asynccontextmanager
+import asyncio
+import os
+
+# Hash barato nos testes; precisa valer antes de importar senhas/main
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+from mongomock_motor import AsyncMongoMockClient  # noqa: E402
+
+from database import Repositorio  # noqa: E402
+
+
+class FalhaDepoisDeGravar:
+    """Coleção que grava e depois levanta erro, como uma conexão perdida após o commit."""
+
+    def __init__(self, colecao, falhas: int = 1, erro: Exception = None):
+        self.colecao = colecao
+        self.falhas = falhas
+        self.erro = erro or ConnectionError("conexão perdida")
+
+    def __getattr__(self, nome):
+        return getattr(self.colecao, nome)
+
+    async def bulk_write(self, *args, **kwargs):
+        resultado = await self.colecao.bulk_write(*args, **kwargs)
+        if self.falhas:
+            self.falhas -= 1
+            raise self.erro
+        return resultado
+
+
+@pytest.fixture
+def repo() -> Repositorio:
+    return Repositorio(AsyncMongoMockClient())
+
+
+@asynccontextmanager
+async def _api():
+    import main
+
+    main.app.state.mongo_client_factory = AsyncMongoMockClient
+    async with main.app.router.lifespan_context(main.app):
+        while not main.app.state.bootstrap.pronto or main.app.state.catalogo.versao is None:
+            await asyncio.sleep(0.01)
+        transporte = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://teste") as cliente:
+            yield main.app, cliente
+
+
+@pytest.fixture
+def api():
+    """`async with api() as (app, cliente)`: API com banco novo em memória."""
+    return _api
+
+
+async def entrar(cliente: httpx.AsyncClient, email: str = "ana@escola.com", username: str = "ana"):
+    """Cadastra o usuário e retorna os headers com o token dele."""
+    await cliente.post("/register", json={"username": username, "email": email, "password": "senha123"})
+    resposta = await cliente.post("/token", data={"username": email, "password": "senha123"})
+    return {"Authorization": f"Bearer {resposta.json()['access_token']}"}
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+import asyncio
+
+from conftest import entrar
+
+
+class ColecaoFora:
+    def find(self, *args, **kwargs):
+        raise RuntimeError("MongoDB fora do ar")
+
+
+def test_eventos_repetidos_sao_ignorados_e_progresso_vem_em_ordem(api):
+    async def cenario():
+        async with api() as (app, cliente):
+            headers = await entrar(cliente)
+            agora = datetime.utcnow().replace(microsecond=0)
+            eventos = [
+                {"id": f"e{i}", "tipo": "progress", "nivel": 1, "pontuacao": i,
+                 "data": (agora - timedelta(minutes=5 - i)).isoformat()}
+                for i in range(3)
+            ]
+            resposta = await cliente.post("/user/events", json={"eventos": eventos}, headers=headers)
+            assert resposta.json()["aceitos"] == 3
+            offline = {"id": "off", "tipo": "progress", "nivel": 2, "pontuacao": 99,
+                       "data": (agora - timedelta(days=2)).isoformat()}
+            resposta = await cliente.post("/user/events", json={"eventos": eventos + [offline]}, headers=headers)
+            assert resposta.json()["aceitos"] == 1
+            assert resposta.json()["duplicados"] == ["e0", "e1", "e2"]
+
+            progresso = (await cliente.get("/user/progress", headers=headers)).json()
+            assert [e["pontuacao"] for e in progresso["progress"]] == [99, 0, 1, 2]
+            assert progresso["next_cursor"] is None
+            assert (await cliente.get("/user/progress?cursor=abc", headers=headers)).status_code == 400
+
+    asyncio.run(cenario())
+
+
+def test_falha_no_historico_vira_500_e_nao_json_cortado(api):
+    async def cenario():
+        async with api() as (app, cliente):
+            headers = await entrar(cliente)
+            historico = app.state.historico
+            colecao, historico.colecao = historico.colecao, ColecaoFora()
+            try:
+                resposta = await cliente.get("/user/progress", headers=headers)
+            finally:
+                historico.colecao = colecao
+            assert resposta.status_code == 500
+            assert "MongoDB fora do ar" in resposta.json()["detail"]
+
+    asyncio.run(cenario())
+
+
+def test_ranking_por_nivel_valida_o_nivel(api):
+    async def cenario():
+        async with api() as (app, cliente):
+            assert (await cliente.get("/ranking?nivel=0")).status_code == 422
+            assert (await cliente.get("/ranking?nivel=999")).status_code == 404
+            assert (await cliente.get("/ranking?nivel=1")).status_code == 200
+
+    asyncio.run(cenario())
+
+
+def test_sessao_sincroniza_so_o_que_mudou(api):
+    async def cenario():
+        async with api() as (app, cliente):
+            headers = await entrar(cliente)
+            inicio = (await cliente.get("/session/bootstrap", headers=headers)).json()
+            assert inicio["completo"] and inicio["usuario"]["nivel"] == 1
+            assert sorted(inicio["atividades"]) == sorted(str(n) for n in app.state.catalogo.niveis())
+
+            params = {"since": inicio["versao"], "catalogo": inicio["catalogo"]}
+            sync = (await cliente.get("/session/sync", params=params, headers=headers)).json()
+            assert not sync["completo"] and sync["atividades"] == {}
+
+    asyncio.run(cenario())
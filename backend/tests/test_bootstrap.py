@@ -0,0 +1,38 @@
+import asyncio
+
+import bootstrap
+from bootstrap import Bootstrap, ATIVIDADES_PADRAO
+
+
+def test_um_unico_worker_executa_o_bootstrap(repo, monkeypatch):
+    monkeypatch.setattr(bootstrap, "BOOTSTRAP_ESPERA_SEGUNDOS", 0.01)
+
+    async def cenario():
+        workers = [Bootstrap(repo) for _ in range(3)]
+        executou = await asyncio.gather(*(w.executar() for w in workers))
+        assert sorted(executou) == [False, False, True]
+        assert all(w.pronto and not w.indices_com_erro for w in workers)
+        assert (await repo.estado_catalogo())["versao"] == 1
+        assert len(await repo.listar_todas_atividades()) == len(ATIVIDADES_PADRAO)
+        # Já em dia: o próximo início não refaz nada
+        assert not await Bootstrap(repo).executar()
+
+    asyncio.run(cenario())
+
+
+def test_indice_unico_sobre_dados_duplicados_nao_trava_o_worker(repo):
+    async def cenario():
+        await repo.db.users.insert_many([
+            {"email": "ana@escola.com", "username": "ana"},
+            {"email": "ana@escola.com", "username": "ana2"},
+        ])
+        worker = Bootstrap(repo)
+        assert await asyncio.wait_for(worker.executar(), timeout=5)
+        assert worker.pronto
+        assert any(indice.startswith("users") for indice in worker.indices_com_erro)
+        estado = await repo.db.meta.find_one({"_id": "bootstrap"})
+        # Sem o hash dos índices a criação é tentada de novo no próximo início
+        assert "hash_indices" not in estado
+        assert estado["indices_com_erro"] == worker.indices_com_erro
+
+    asyncio.run(cenario())
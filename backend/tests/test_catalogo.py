@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from catalogo import CatalogoCache, EntradaCatalogo, _versoes_por_nivel
+from historico import Historico
+from ranking import Ranking
+from sessao import Sessao
+
+USUARIO = {"email": "ana@escola.com", "username": "ana"}
+
+
+@pytest.mark.parametrize("if_none_match, esperado", [
+    (None, False),
+    ('"outro"', False),
+    ("*", True),
+    ("{etag}", True),
+    ("W/{etag}", True),
+    ('"outro", W/{etag}', True),
+])
+def test_if_none_match_comparacao_fraca(if_none_match, esperado):
+    entrada = EntradaCatalogo(1, [{"_id": 1, "conteudo": "A"}])
+    if if_none_match:
+        if_none_match = if_none_match.format(etag=entrada.etag)
+    assert entrada.corresponde(if_none_match) is esperado
+
+
+@pytest.mark.parametrize("estado, esperado", [
+    ({}, (0, 0, {})),
+    ({"versao": 3, "alteracoes": [{"versao": 2, "niveis": [1]}, {"versao": 3, "niveis": [2]}]},
+     (3, 1, {1: 2, 2: 3})),
+    # Versão 3 incrementada fora da API, sem informar os níveis: todos contam como alterados nela
+    ({"versao": 4, "alteracoes": [{"versao": 2, "niveis": [1]}, {"versao": 4, "niveis": [2]}]},
+     (4, 3, {2: 4})),
+    ({"versao": 4, "alteracoes": [{"versao": 2, "niveis": [1]}, {"versao": 3, "niveis": [2]}]},
+     (4, 4, {})),
+])
+def test_versoes_por_nivel(estado, esperado):
+    assert _versoes_por_nivel(estado) == esperado
+
+
+def test_incrementos_simultaneos_nao_se_perdem(repo):
+    async def cenario():
+        await asyncio.gather(*(repo.incrementar_versao_catalogo([nivel]) for nivel in range(1, 6)))
+        estado = await repo.estado_catalogo()
+        assert estado["versao"] == 5
+        assert sorted(a["versao"] for a in estado["alteracoes"]) == [1, 2, 3, 4, 5]
+
+    asyncio.run(cenario())
+
+
+def test_sync_em_outro_worker_envia_nivel_alterado(repo):
+    async def cenario():
+        await repo.salvar_atividades([
+            {"_id": 1, "tipo": "letra", "conteudo": "A", "nivel": 1},
+            {"_id": 2, "tipo": "letra", "conteudo": "B", "nivel": 2},
+        ])
+        await repo.incrementar_versao_catalogo([1, 2])
+        atualizado, atrasado = CatalogoCache(repo), CatalogoCache(repo)
+        await atualizado.carregar()
+        await atrasado.carregar()
+        await repo.salvar_atividades([{"_id": 2, "tipo": "letra", "conteudo": "BB", "nivel": 2}])
+        await repo.incrementar_versao_catalogo([2])
+        # Só um dos workers recarregou até aqui
+        await atualizado.carregar()
+
+        historico, ranking = Historico(repo), Ranking(repo)
+        sessao_atualizada = Sessao(repo, historico, atualizado, ranking)
+        sessao_atrasada = Sessao(repo, historico, atrasado, ranking)
+
+        inicio = await sessao_atrasada.montar(USUARIO, 10)
+        assert inicio["atividades"][2][0]["conteudo"] == "B"
+        sync = await sessao_atualizada.montar(USUARIO, 10, desde=inicio["versao"], catalogo=inicio["catalogo"])
+        assert list(sync["atividades"]) == [2]
+        assert sync["atividades"][2][0]["conteudo"] == "BB"
+        seguinte = await sessao_atualizada.montar(USUARIO, 10, desde=sync["versao"], catalogo=sync["catalogo"])
+        assert seguinte["atividades"] == {}
+
+        # Versão incrementada sem informar os níveis: tudo é reenviado
+        await repo.db.meta.update_one({"_id": "catalogo"}, {"$inc": {"versao": 1}})
+        await atrasado.carregar()
+        externo = await sessao_atrasada.montar(USUARIO, 10, desde=sync["versao"], catalogo=sync["catalogo"])
+        assert sorted(externo["atividades"]) == [1, 2]
+
+    asyncio.run(cenario())
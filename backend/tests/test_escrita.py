@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+import asyncio
+
+import pytest
+
+from conftest import FalhaDepoisDeGravar
+from escrita import FilaEscrita, FilaCheia
+from historico import Historico, TIPO_PROGRESSO
+from ranking import Ranking
+
+
+def _fila(repo, **kwargs) -> FilaEscrita:
+    return FilaEscrita(repo, Historico(repo), Ranking(repo), **kwargs)
+
+
+async def _eventos(historico: Historico, email: str):
+    return [e async for e, _ in historico.paginar(email, TIPO_PROGRESSO, 100) if e is not None]
+
+
+def test_falha_parcial_regrava_so_o_historico_sem_duplicar(repo):
+    async def cenario():
+        fila = _fila(repo)
+        await repo.criar_usuario({"email": "ana@escola.com", "username": "ana", "nivel": 1})
+        agora = datetime.utcnow()
+        fila.progresso("ana@escola.com", "ana", 2, 10, agora)
+        fila.progresso("ana@escola.com", "ana", 3, 20, agora + timedelta(seconds=1))
+
+        # O bulk_write do histórico grava e a resposta se perde
+        colecao = fila.historico.colecao
+        fila.historico.colecao = FalhaDepoisDeGravar(colecao)
+        assert not await fila.descarregar()
+        pendente = fila._pendentes["ana@escola.com"]
+        assert pendente.nivel is None and pendente.ranking == {}
+        assert len(pendente) == 2 and pendente.verificar_historico
+
+        assert await fila.descarregar()
+        assert not fila._pendentes
+        assert [e["pontuacao"] for e in await _eventos(fila.historico, "ana@escola.com")] == [10, 20]
+        usuario = await repo.buscar_usuario("ana@escola.com", {"nivel": 1})
+        assert usuario["nivel"] == 3
+
+    asyncio.run(cenario())
+
+
+def test_gravar_agora_reenvio_nao_duplica_eventos(repo):
+    async def cenario():
+        fila = _fila(repo)
+        await repo.criar_usuario({"email": "ana@escola.com", "username": "ana", "nivel": 1})
+        agora = datetime.utcnow()
+        lote = [("e1", TIPO_PROGRESSO, 1, 5, agora), ("e2", TIPO_PROGRESSO, 2, 8, agora)]
+        await fila.gravar_agora("ana@escola.com", "ana", lote)
+        await fila.gravar_agora("ana@escola.com", "ana", lote + [("e3", TIPO_PROGRESSO, 2, 9, agora)])
+        assert [e["pontuacao"] for e in await _eventos(fila.historico, "ana@escola.com")] == [5, 8, 9]
+        assert await fila.historico.existentes("ana@escola.com", TIPO_PROGRESSO, [
+            {"id": "e1", "data": agora}, {"id": "outro", "data": agora},
+        ]) == {"e1"}
+
+    asyncio.run(cenario())
+
+
+def test_pontuacao_mais_antiga_nao_sobrescreve_a_mais_recente(repo):
+    async def cenario():
+        fila = _fila(repo)
+        await repo.criar_usuario({"email": "ana@escola.com", "username": "ana", "nivel": 1})
+        agora = datetime.utcnow()
+        fila.pontuacao("ana@escola.com", "ana", 50, agora)
+        assert await fila.descarregar()
+        # Evento offline com data anterior chega depois
+        await fila.gravar_agora("ana@escola.com", "ana", [("antigo", "pontuacao", None, 30, agora - timedelta(hours=1))])
+        usuario = await repo.buscar_usuario("ana@escola.com", {"pontuacao_total": 1})
+        assert usuario["pontuacao_total"] == 50
+
+    asyncio.run(cenario())
+
+
+def test_fila_cheia_recusa_novas_escritas(repo):
+    async def cenario():
+        fila = _fila(repo, limite=2)
+        agora = datetime.utcnow()
+        fila.pontuacao("ana@escola.com", "ana", 1, agora)
+        fila.pontuacao("ana@escola.com", "ana", 2, agora)
+        with pytest.raises(FilaCheia) as erro:
+            fila.pontuacao("ana@escola.com", "ana", 3, agora)
+        assert erro.value.retry_after >= 1
+
+    asyncio.run(cenario())
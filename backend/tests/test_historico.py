@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta
+import asyncio
+
+import pytest
+from bson import ObjectId
+
+import historico as modulo
+from historico import Historico, TIPO_PROGRESSO, codificar_cursor, decodificar_cursor
+
+
+async def _pagina(historico: Historico, limite: int, cursor=None):
+    eventos, proximo = [], None
+    async for evento, cursor_seguinte in historico.paginar("ana@escola.com", TIPO_PROGRESSO, limite, cursor=cursor):
+        if evento is None:
+            proximo = cursor_seguinte
+        else:
+            eventos.append(evento["pontuacao"])
+    return eventos, proximo
+
+
+def _evento(id, pontuacao, data):
+    return {"id": id, "nivel": 1, "pontuacao": pontuacao, "data": data}
+
+
+def test_cursor_ida_e_volta():
+    data = datetime(2024, 5, 1, 12, 30, 15, 123000)
+    bucket = ObjectId()
+    assert decodificar_cursor(codificar_cursor(data, bucket, 7)) == (data, bucket, 7)
+
+
+@pytest.mark.parametrize("cursor", ["abc", "", "MTIzOmZvbzox", "!!!"])
+def test_cursor_invalido(cursor):
+    with pytest.raises(ValueError):
+        decodificar_cursor(cursor)
+
+
+def test_evento_offline_aparece_na_ordem_da_data(repo):
+    async def cenario():
+        historico = Historico(repo)
+        agora = datetime.utcnow().replace(microsecond=0)
+        await historico.registrar("ana@escola.com", TIPO_PROGRESSO, [
+            _evento(f"h{i}", i, agora - timedelta(minutes=10 - i)) for i in range(5)
+        ])
+        # Gravado depois, em um bucket novo, mas com data de três dias atrás
+        await historico.registrar("ana@escola.com", TIPO_PROGRESSO, [_evento("off", 99, agora - timedelta(days=3))])
+
+        assert (await _pagina(historico, 100))[0] == [99, 0, 1, 2, 3, 4]
+
+        paginas, cursor = [], None
+        while True:
+            eventos, cursor = await _pagina(historico, 2, cursor)
+            paginas.append(eventos)
+            if cursor is None:
+                break
+        assert paginas == [[99, 0], [1, 2], [3, 4]]
+
+    asyncio.run(cenario())
+
+
+def test_paginacao_com_datas_iguais_nao_repete_nem_pula(repo):
+    async def cenario():
+        historico = Historico(repo)
+        agora = datetime.utcnow().replace(microsecond=0)
+        await historico.registrar("ana@escola.com", TIPO_PROGRESSO, [_evento(f"a{i}", i, agora) for i in range(3)])
+        await historico.registrar("ana@escola.com", TIPO_PROGRESSO, [_evento(f"b{i}", 10 + i, agora) for i in range(3)])
+
+        vistos, cursor = [], None
+        while True:
+            eventos, cursor = await _pagina(historico, 4, cursor)
+            vistos += eventos
+            if cursor is None:
+                break
+        assert sorted(vistos) == [0, 1, 2, 10, 11, 12]
+
+    asyncio.run(cenario())
+
+
+def test_bucket_nao_passa_do_maximo(repo, monkeypatch):
+    monkeypatch.setattr(modulo, "HISTORICO_BUCKET_MAX", 3)
+
+    async def cenario():
+        historico = Historico(repo)
+        dia = datetime(2024, 5, 1, 12)
+        await historico.registrar("ana@escola.com", TIPO_PROGRESSO, [_evento("x", 0, dia)])
+        # Lote maior que um bucket inteiro, no mesmo dia de um bucket já começado
+        await historico.registrar("ana@escola.com", TIPO_PROGRESSO, [
+            _evento(f"e{i}", i + 1, dia + timedelta(minutes=i)) for i in range(7)
+        ])
+        tamanhos = [len(doc["eventos"]) async for doc in historico.colecao.find({})]
+        assert sum(tamanhos) == 8
+        assert max(tamanhos) <= 3
+        assert [doc["n"] async for doc in historico.colecao.find({})] == tamanhos
+        assert (await _pagina(historico, 100))[0] == list(range(8))
+
+    asyncio.run(cenario())
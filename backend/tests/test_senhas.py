@@ -0,0 +1,48 @@
+import asyncio
+import threading
+
+import pytest
+
+from senhas import ServicoSenhas, SobrecargaSenhas
+
+
+def test_cancelar_quem_espera_nao_libera_vaga_de_hash_em_execucao():
+    async def cenario():
+        senhas = ServicoSenhas(rounds=4, workers=1, max_fila=2)
+        trava = threading.Event()
+        try:
+            tarefas = [asyncio.create_task(senhas._submeter("teste", trava.wait)) for _ in range(3)]
+            await asyncio.sleep(0.05)
+            for tarefa in tarefas:
+                tarefa.cancel()
+            await asyncio.sleep(0.05)
+            # Os dois na fila do pool foram descartados; o primeiro continua rodando
+            assert senhas._pendentes == 1
+            trava.set()
+            await asyncio.sleep(0.05)
+            assert senhas._pendentes == 0
+        finally:
+            trava.set()
+            senhas.fechar()
+
+    asyncio.run(cenario())
+
+
+def test_fila_cheia_recusa_com_retry_after():
+    async def cenario():
+        senhas = ServicoSenhas(rounds=4, workers=1, max_fila=1)
+        trava = threading.Event()
+        try:
+            tarefas = [asyncio.create_task(senhas._submeter("teste", trava.wait)) for _ in range(2)]
+            await asyncio.sleep(0.05)
+            with pytest.raises(SobrecargaSenhas) as erro:
+                await senhas.gerar_hash("senha")
+            assert erro.value.retry_after >= 1
+            trava.set()
+            await asyncio.gather(*tarefas)
+            assert await senhas.verificar("senha", await senhas.gerar_hash("senha"))
+        finally:
+            trava.set()
+            senhas.fechar()
+
+    asyncio.run(cenario())
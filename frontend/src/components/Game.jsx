@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useAuth } from '../contexts/AuthContext';
 import LevelComplete from './LevelComplete';
 import Ranking from './Ranking';
@@ -15,22 +15,79 @@ function Game() {
   const MAX_LEVEL = 4; // Número total de níveis
   const { user } = useAuth();
   const [showRanking, setShowRanking] = useState(false);
+  // Atividades de todos os níveis, ranking e versões recebidos de /session/bootstrap
+  const [catalogo, setCatalogo] = useState(null);
+  const [ranking, setRanking] = useState(null);
+  const versaoSessao = useRef(null);
+  const versaoCatalogo = useRef(null);
+  const primeiraCarga = useRef(true);
 
   useEffect(() => {
-    carregarAtividades();
-  }, [nivelAtual]);
+    iniciarSessao();
+  }, []);
 
-  const carregarAtividades = async () => {
+  useEffect(() => {
+    if (catalogo !== null) carregarAtividades();
+  }, [nivelAtual, catalogo === null]);
+
+  // Uma única requisição no início: nível do usuário, o catálogo inteiro e o ranking
+  const iniciarSessao = async () => {
     try {
-      setCarregando(true);
-      const response = await fetch(`${import.meta.env.VITE_API_URL}/atividades/?nivel=${nivelAtual}`, {
+      const response = await fetch(`${import.meta.env.VITE_API_URL}/session/bootstrap`, {
         headers: {
           'Authorization': `Bearer ${user.token}`,
         },
       });
-      if (!response.ok) throw new Error('Erro ao carregar atividades');
+      if (!response.ok) throw new Error('Erro ao iniciar sessão');
       const data = await response.json();
-      setAtividades(data.atividades || []);
+      versaoSessao.current = data.versao;
+      versaoCatalogo.current = data.catalogo;
+      if (data.usuario) setNivelAtual(Math.min(data.usuario.nivel, MAX_LEVEL));
+      if (data.ranking) setRanking(data.ranking);
+      setCatalogo(data.atividades);
+    } catch (error) {
+      console.error('Erro:', error);
+      setCatalogo({}); // Sem sessão: busca as atividades nível a nível
+    }
+  };
+
+  // Ao trocar de nível ou abrir o ranking, traz só o que mudou desde a última versão
+  const sincronizarSessao = async () => {
+    const parametros = `since=${versaoSessao.current}&catalogo=${versaoCatalogo.current}`;
+    const response = await fetch(`${import.meta.env.VITE_API_URL}/session/sync?${parametros}`, {
+      headers: {
+        'Authorization': `Bearer ${user.token}`,
+      },
+    });
+    if (!response.ok) throw new Error('Erro ao sincronizar sessão');
+    const data = await response.json();
+    versaoSessao.current = data.versao;
+    versaoCatalogo.current = data.catalogo;
+    if (data.ranking) setRanking(data.ranking);
+    const atualizado = { ...catalogo, ...data.atividades };
+    setCatalogo(atualizado);
+    return atualizado;
+  };
+
+  const carregarAtividades = async () => {
+    try {
+      setCarregando(true);
+      let doNivel = catalogo[nivelAtual];
+      if (versaoSessao.current !== null && !primeiraCarga.current) {
+        doNivel = (await sincronizarSessao())[nivelAtual];
+      }
+      primeiraCarga.current = false;
+      if (!doNivel) {
+        const response = await fetch(`${import.meta.env.VITE_API_URL}/atividades/?nivel=${nivelAtual}`, {
+          headers: {
+            'Authorization': `Bearer ${user.token}`,
+          },
+        });
+        if (!response.ok) throw new Error('Erro ao carregar atividades');
+        const data = await response.json();
+        doNivel = data.atividades;
+      }
+      setAtividades(doNivel || []);
       setAtividadeAtual(0); // Reseta a atividade atual ao carregar atividades
     } catch (error) {
       console.error('Erro:', error);
@@ -39,6 +96,13 @@ function Game() {
     }
   };
 
+  const abrirRanking = () => {
+    setShowRanking(true);
+    if (versaoSessao.current !== null) {
+      sincronizarSessao().catch((error) => console.error('Erro:', error));
+    }
+  };
+
   const verificarResposta = () => {
     if (!atividades[atividadeAtual]) return;
     const atividadeCorreta = atividades[atividadeAtual];
@@ -224,7 +288,7 @@ function Game() {
         <div className="flex justify-between items-center mb-4">
           <h1 className="text-3xl font-bold text-purple-600">Alfabetizar com Amor</h1>  {/* Mudei o título aqui */}
           <button
-            onClick={() => setShowRanking(true)}
+            onClick={abrirRanking}
             className="bg-purple-600 text-white px-4 py-2 rounded-lg hover:bg-purple-700 transition"
           >
             🏆 Ranking
@@ -322,6 +386,7 @@ function Game() {
           isOpen={showRanking}
           onClose={() => setShowRanking(false)}
           pontuacaoAtual={pontuacao}
+          ranking={ranking}
         />
       )}
       
@@ -1,16 +1,19 @@
 import { useState, useEffect } from 'react';
 import { useAuth } from '../contexts/AuthContext';
 
-const Ranking = ({ isOpen, onClose, pontuacaoAtual }) => {
-  const [ranking, setRanking] = useState([]);
+const Ranking = ({ isOpen, onClose, pontuacaoAtual, ranking: rankingSessao }) => {
+  const [rankingBuscado, setRankingBuscado] = useState([]);
   const [loading, setLoading] = useState(true);
   const { user } = useAuth();
 
   useEffect(() => {
-    if (isOpen) {
+    // Com a sessão do jogo o ranking já vem de /session/bootstrap e /session/sync
+    if (isOpen && !rankingSessao) {
       carregarRanking();
     }
-  }, [isOpen]);
+  }, [isOpen, rankingSessao]);
+
+  const ranking = rankingSessao || rankingBuscado;
 
   const carregarRanking = async () => {
     try {
@@ -20,7 +23,7 @@ const Ranking = ({ isOpen, onClose, pontuacaoAtual }) => {
         }
       });
       const data = await response.json();
-      setRanking(data.ranking);
+      setRankingBuscado(data.ranking);
     } catch (error) {
       console.error('Erro ao carregar ranking:', error);
     } finally {
@@ -37,7 +40,7 @@ const Ranking = ({ isOpen, onClose, pontuacaoAtual }) => {
           🏆 Ranking de Jogadores
         </h2>
 
-        {loading ? (
+        {loading && !rankingSessao ? (
           <div className="flex justify-center">
             <div className="animate-spin rounded-full h-8 w-8 border-b-2 border-purple-600"></div>
           </div>